@@ -0,0 +1,63 @@
+"""
+Сравнение построения дерева категорий через pandas.iterrows (прежняя реализация загрузки категорий)
+и однопроходного build_category_tree на синтетическом листе "категории".
+
+Запуск из корня репозитория:
+    python -m benchmarks.category_tree --rows 50000
+"""
+import argparse
+import random
+import timeit
+
+from marketing_budget_tennisi_bot.categories import build_category_tree
+
+
+def make_records(rows: int, seed: int = 0) -> list[dict]:
+    """Синтетический лист: 40 статей, по 25 групп, партнёры с повторами и пустыми строками"""
+
+    rnd = random.Random(seed)
+    records = []
+    for _ in range(rows):
+        if rnd.random() < 0.01:
+            records.append({"Статья": "", "Группа": "", "Партнер": ""})
+            continue
+        records.append({
+            "Статья": f"Статья {rnd.randrange(40)}",
+            "Группа": f"Группа {rnd.randrange(25)}",
+            "Партнер": f"Партнер {rnd.randrange(rows // 2)}",
+        })
+    return records
+
+
+def build_with_iterrows(records: list[dict]) -> tuple[dict, list]:
+    import pandas as pd
+
+    df = pd.DataFrame(records)
+    unique_items = df["Статья"].unique()
+    data_structure = {}
+    for _, row in df.iterrows():
+        data_structure.setdefault(row["Статья"], {}).setdefault(row["Группа"], []).append(row["Партнер"])
+    return data_structure, unique_items
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    records = make_records(args.rows)
+    builders = [("build_category_tree", build_category_tree)]
+    try:
+        import pandas  # noqa: F401
+        builders.append(("pandas.iterrows", build_with_iterrows))
+    except ImportError:
+        print("pandas не установлен, сравнение с iterrows пропущено")
+
+    for name, builder in builders:
+        best = min(timeit.repeat(lambda: builder(records), number=1, repeat=args.repeat))
+        print(f"{name:>20}: {best * 1000:9.1f} мс на {args.rows} строк")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Запись пачки оплаченных счетов в Google Sheets через очередь 'sheets_outbox' на FakeSheetsBackend
+в сравнении с записью каждого счёта отдельно (очередь с пачкой из одного счёта). Сеть и учётные данные не нужны.
+
+Запуск из корня репозитория:
+    python -m benchmarks.sheets_outbox --invoices 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import time
+
+for name, value in {
+    "TELEGRAM_BOT_TOKEN": "benchmark",
+    "DATABASE_PATH": ":memory:",
+    "GOOGLE_SHEETS_SPREADSHEET_ID": "benchmark",
+    "GOOGLE_SHEETS_RECORDS_SHEET_ID": "0",
+    "GOOGLE_SHEETS_CATEGORIES_SHEET_ID": "1",
+    "HEAD_CHAT_IDS": "0",
+    "FINANCE_CHAT_IDS": "0",
+    "PAYERS_CHAT_IDS": "0",
+    "INITIATORS_CHAT_IDS": "0",
+    "DEVELOPER_CHAT_ID": "0",
+    "WHITE_LIST": "0",
+    "SHEETS_BACKEND": "fake",
+    "SHEETS_READS_PER_MINUTE": "100000",
+    "SHEETS_WRITES_PER_MINUTE": "100000",
+}.items():
+    os.environ.setdefault(name, value)
+os.makedirs("logs", exist_ok=True)
+
+from db import db  # noqa: E402
+from marketing_budget_tennisi_bot import sheets  # noqa: E402
+from marketing_budget_tennisi_bot.outbox import SheetsOutboxWorker, sheets_outbox  # noqa: E402
+
+
+async def pay_invoices(count: int) -> None:
+    for i in range(count):
+        record = await db.insert_record({
+            "amount": 1000 + i,
+            "expense_item": "Статья",
+            "expense_group": "Группа",
+            "partner": f"Партнер {i}",
+            "comment": "benchmark",
+            "period": "01.24 02.24" if i % 3 == 0 else "01.24",
+            "payment_method": "безнал",
+            "approvals_needed": 1,
+            "approvals_received": 1,
+            "status": "Approved",
+            "approved_by": "benchmark",
+            "initiator_id": 0,
+        })
+        await db.transition(record.id, ("Approved",), "Paid", enqueue_sheets_write=True)
+
+
+async def run(invoices: int, latency: float) -> None:
+    backend = sheets.client_manager
+    backend.latency = latency
+    await db.initialize()
+    one_by_one = SheetsOutboxWorker(
+        sheets_outbox.batch_window, 1, sheets_outbox.base_delay, sheets_outbox.max_delay, sheets_outbox.poll_interval,
+    )
+
+    for name, worker in (("по одному счёту", one_by_one), ("через очередь", sheets_outbox)):
+        await pay_invoices(invoices)
+        backend.calls.clear()
+        started = time.perf_counter()
+        while await worker.flush():
+            pass
+        print(f"{name:>15}: {time.perf_counter() - started:7.2f} с, запросов: {sum(backend.calls.values())}")
+    await db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(run(args.invoices, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,45 @@ class Config:
     telegram_bot_token: str = getenv("TELEGRAM_BOT_TOKEN")
     google_sheets_spreadsheet_id: str = getenv("GOOGLE_SHEETS_SPREADSHEET_ID")
     database_path: str = getenv("DATABASE_PATH")
+    database_pool_size: int = int(getenv("DATABASE_POOL_SIZE", 3))
+    database_cache_size: int = int(getenv("DATABASE_CACHE_SIZE", 256))
+    archive_after_days: int = int(getenv("ARCHIVE_AFTER_DAYS", 90))
+    archive_batch_size: int = int(getenv("ARCHIVE_BATCH_SIZE", 500))
+    archive_interval_hours: float = float(getenv("ARCHIVE_INTERVAL_HOURS", 24))
+    backup_dir: str = getenv("BACKUP_DIR", "./backups")
+    backup_interval_hours: float = float(getenv("BACKUP_INTERVAL_HOURS", 24))
+    backup_keep: int = int(getenv("BACKUP_KEEP", 7))
+    backup_pages_per_step: int = int(getenv("BACKUP_PAGES_PER_STEP", 256))
+    backup_step_sleep: float = float(getenv("BACKUP_STEP_SLEEP", 0.05))
+    stats_log_interval_minutes: float = float(getenv("STATS_LOG_INTERVAL_MINUTES", 60))
     google_sheets_credentials_file: str = getenv("GOOGLE_SHEETS_CREDENTIALS_FILE")
     google_sheets_categories_sheet_id: int = getenv("GOOGLE_SHEETS_CATEGORIES_SHEET_ID")
     google_sheets_records_sheet_id: int = getenv("GOOGLE_SHEETS_RECORDS_SHEET_ID")
+    categories_cache_ttl: float = float(getenv("CATEGORIES_CACHE_TTL", 600))
+    categories_fingerprint_cell: str = getenv("CATEGORIES_FINGERPRINT_CELL", "")
+    max_concurrent_updates: int = int(getenv("MAX_CONCURRENT_UPDATES", 32))
+    telegram_webhook_url: str = getenv("TELEGRAM_WEBHOOK_URL")
+    webhook_listen: str = getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    webhook_port: int = int(getenv("WEBHOOK_PORT", 8080))
+    webhook_health_port: int = int(getenv("WEBHOOK_HEALTH_PORT", 8081))
+    webhook_secret_token: str = getenv("WEBHOOK_SECRET_TOKEN")
+    telegram_messages_per_second: float = float(getenv("TELEGRAM_MESSAGES_PER_SECOND", 25))
+    telegram_chat_messages_per_second: float = float(getenv("TELEGRAM_CHAT_MESSAGES_PER_SECOND", 1))
+    telegram_fanout_concurrency: int = int(getenv("TELEGRAM_FANOUT_CONCURRENCY", 8))
+    telegram_send_attempts: int = int(getenv("TELEGRAM_SEND_ATTEMPTS", 3))
+    sheets_backend: str = getenv("SHEETS_BACKEND", "google")
+    sheets_fake_latency: float = float(getenv("SHEETS_FAKE_LATENCY", 0.2))
+    sheets_fake_reads_per_minute: int = int(getenv("SHEETS_FAKE_READS_PER_MINUTE", 0))
+    sheets_fake_writes_per_minute: int = int(getenv("SHEETS_FAKE_WRITES_PER_MINUTE", 0))
+    sheets_fake_failure_rate: float = float(getenv("SHEETS_FAKE_FAILURE_RATE", 0))
+    sheets_fake_categories_file: str = getenv("SHEETS_FAKE_CATEGORIES_FILE")
+    sheets_reads_per_minute: float = float(getenv("SHEETS_READS_PER_MINUTE", 60))
+    sheets_writes_per_minute: float = float(getenv("SHEETS_WRITES_PER_MINUTE", 60))
+    sheets_outbox_batch_window: float = float(getenv("SHEETS_OUTBOX_BATCH_WINDOW", 2))
+    sheets_outbox_batch_size: int = int(getenv("SHEETS_OUTBOX_BATCH_SIZE", 100))
+    sheets_outbox_base_delay: float = float(getenv("SHEETS_OUTBOX_BASE_DELAY", 5))
+    sheets_outbox_max_delay: float = float(getenv("SHEETS_OUTBOX_MAX_DELAY", 900))
+    sheets_outbox_poll_interval: float = float(getenv("SHEETS_OUTBOX_POLL_INTERVAL", 30))
     head_chat_ids: list[int] = list(map(int, getenv("HEAD_CHAT_IDS").split(",")))
     finance_chat_ids: list[int] = list(map(int, getenv("FINANCE_CHAT_IDS").split(",")))
     payers_chat_ids: list[int] = list(map(int, getenv("PAYERS_CHAT_IDS").split(",")))
@@ -1,9 +1,4 @@
-from db.db import ApprovalDB
+from db.db import ApprovalDB, ApprovalRecord
 
-import asyncio
-
-__all__ = ["db"]
+__all__ = ["db", "ApprovalRecord"]
 db = ApprovalDB()
-
-loop = asyncio.get_event_loop()
-loop.run_until_complete(db.create_table())
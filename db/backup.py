@@ -0,0 +1,90 @@
+import asyncio
+import glob
+import hashlib
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from config.logging_config import logger
+
+BACKUP_PREFIX = "approvals-"
+BACKUP_SUFFIX = ".db"
+
+
+def _copy_online(source_path: str, target_path: str, pages: int, sleep: float) -> None:
+    """
+    Копирует базу через online backup API SQLite по pages страниц за шаг с паузой sleep секунд
+    между шагами. Запись в базу между шагами не блокируется, в копию попадает согласованный снимок.
+    """
+
+    def pause(status: int, remaining: int, total: int) -> None:
+        # параметр sleep у backup() действует только при SQLITE_BUSY/SQLITE_LOCKED,
+        # поэтому пауза между шагами выдерживается здесь
+        if remaining:
+            time.sleep(sleep)
+
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, progress=pause)
+    finally:
+        target.close()
+        source.close()
+
+
+def _sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Контрольная сумма файла, читаемого по частям"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _list_backups(backup_dir: str) -> list[str]:
+    """Копии в backup_dir от старой к новой: имя файла содержит дату создания"""
+    return sorted(glob.glob(os.path.join(backup_dir, f"{BACKUP_PREFIX}*{BACKUP_SUFFIX}")))
+
+
+def last_backup_time(backup_dir: str) -> float | None:
+    """Время изменения самой новой копии (timestamp) или None, если копий нет"""
+    backups = _list_backups(backup_dir)
+    return os.path.getmtime(backups[-1]) if backups else None
+
+
+def _rotate(backup_dir: str, keep: int) -> None:
+    """Удаляет самые старые копии и их контрольные суммы, оставляя keep последних"""
+    backups = _list_backups(backup_dir)
+    for path in backups[:-keep] if keep > 0 else backups:
+        for stale in (path, f"{path}.sha256"):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+
+async def backup_database(source_path: str, backup_dir: str, keep: int,
+                          pages: int = 256, sleep: float = 0.05) -> str:
+    """
+    Создаёт резервную копию базы в backup_dir, записывает рядом файл .sha256 в формате sha256sum
+    и оставляет keep последних копий. Копирование и подсчёт суммы выполняются в отдельном потоке,
+    поэтому цикл событий бота продолжает обрабатывать обновления. Возвращает путь к копии.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    name = f"{BACKUP_PREFIX}{datetime.now():%Y%m%d-%H%M%S}{BACKUP_SUFFIX}"
+    target_path = os.path.join(backup_dir, name)
+    partial_path = f"{target_path}.part"
+
+    try:
+        await asyncio.to_thread(_copy_online, source_path, partial_path, pages, sleep)
+        checksum = await asyncio.to_thread(_sha256, partial_path)
+        os.replace(partial_path, target_path)
+        with open(f"{target_path}.sha256", "w", encoding="utf-8") as file:
+            file.write(f"{checksum}  {name}\n")
+        await asyncio.to_thread(_rotate, backup_dir, keep)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise RuntimeError(f"Не удалось создать резервную копию базы данных: {e}")
+
+    logger.info(f"Создана резервная копия базы данных: {target_path}, sha256: {checksum}")
+    return target_path
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """
+    Ограниченный по размеру кэш, вытесняющий давно не использованные значения.
+
+    Поколение (generation) увеличивается при каждой инвалидации. Значение, прочитанное из базы,
+    кладётся в кэш методом put_if_current только если с начала чтения не было записей - так
+    медленное чтение не перезапишет кэш устаревшими данными после параллельного обновления.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._data: OrderedDict[Hashable, V] = OrderedDict()
+
+    def get(self, key: Hashable) -> V | None:
+        """Возвращает значение по ключу и учитывает попадание или промах."""
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        """Кладёт значение в кэш, вытесняя самое старое при переполнении."""
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def put_if_current(self, key: Hashable, value: V, generation: int) -> None:
+        """Кладёт прочитанное значение, если с поколения generation не было инвалидаций."""
+        if generation == self.generation:
+            self.put(key, value)
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        """Удаляет значение по ключу или, без ключа, очищает кэш целиком."""
+        self.generation += 1
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    def info(self) -> dict[str, int]:
+        """Счётчики попаданий и промахов и текущий размер кэша."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
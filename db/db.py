@@ -1,110 +1,262 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable
+
 import aiosqlite
 
 from config.config import Config
 from config.logging_config import logger
+from db.cache import LRUCache
+from db.migrations import migrate
+
+# Настройки, применяемые к каждому новому соединению
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+# UPDATE ... RETURNING поддерживается начиная с SQLite 3.35
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Столбцы таблицы 'approvals' и их подписи для вывода неоплаченных заявок
+DISPLAY_LABELS = (
+    ("id", "id заявки"),
+    ("amount", "сумма"),
+    ("expense_item", "статья"),
+    ("expense_group", "группа"),
+    ("partner", "партнёр"),
+    ("comment", "комментарий"),
+    ("period", "период дат"),
+    ("payment_method", "способ оплаты"),
+    ("approvals_needed", "апрувов требуется"),
+    ("approvals_received", "апрувов получено"),
+    ("status", "статус"),
+    ("approved_by", "кто апрувил"),
+    ("initiator_id", "инициатор"),
+    ("created_at", "создан"),
+)
+
+COLUMNS = tuple(column for column, _ in DISPLAY_LABELS)
+SELECT_COLUMNS = ", ".join(COLUMNS)
+
+
+@dataclass(frozen=True, slots=True)
+class ApprovalRecord:
+    """Запись о счёте из таблицы 'approvals'"""
+
+    id: int
+    amount: float
+    expense_item: str
+    expense_group: str
+    partner: str
+    comment: str
+    period: str
+    payment_method: str
+    approvals_needed: int
+    approvals_received: int
+    status: str
+    approved_by: str | None
+    initiator_id: int | None
+    created_at: str | None
+
+    @classmethod
+    def from_row(cls, cursor: sqlite3.Cursor, row: tuple) -> 'ApprovalRecord':
+        """row_factory для запросов, выбирающих столбцы SELECT_COLUMNS"""
+        return cls(*row)
+
+    def to_display(self) -> dict[str, any]:
+        """Словарь из подписей и значений столбцов для вывода пользователю"""
+        return {label: getattr(self, column) for column, label in DISPLAY_LABELS}
+
+
+@dataclass(frozen=True, slots=True)
+class SheetsWrite:
+    """Задание очереди 'sheets_outbox' на запись оплаченного счёта в Google Sheets"""
+
+    id: int
+    row_id: int
+    attempts: int
+    created_at: str | None  # время оплаты счёта, UTC
+
+
+NOT_PAID_PAGE_SIZE = 50
+
+# Верхняя граница пакета архивации: id пакета передаются параметрами запроса,
+# а старые сборки SQLite допускают не более 999 параметров
+MAX_ARCHIVE_BATCH_SIZE = 500
 
 
 class ApprovalDB:
-    """База данных для хранения данных о заявке"""
+    """База данных для хранения данных о заявке.
+
+    При pool_size > 0 держит пул постоянных соединений на всё время работы процесса и выдаёт
+    их на время одной операции. При pool_size = 0 открывает новое соединение на каждую операцию.
+    Создание объекта не выполняет ввода-вывода: пул открывается при первом обращении,
+    схема подготавливается методом initialize при запуске бота.
+    Записи, прочитанные по id, хранятся в LRU-кэше; все изменения через методы класса
+    обновляют или сбрасывают кэш и увеличивают write_generation, по которому кэшируют
+    свои результаты вызывающие модули.
+    """
 
-    def __init__(self):
-        self.db_file = Config.database_path
+    def __init__(self, db_file: str | None = None, pool_size: int | None = None):
+        self.db_file = db_file or Config.database_path
+        self.pool_size = Config.database_pool_size if pool_size is None else pool_size
+        if self.db_file == ":memory:":
+            # база в памяти живёт, пока открыто её единственное соединение
+            self.pool_size = 1
+        self._pool: asyncio.Queue[aiosqlite.Connection] | None = None
+        self._pool_lock = asyncio.Lock()
+        self._initialized = False
+        self._cache: LRUCache[ApprovalRecord] = LRUCache(Config.database_cache_size)
+        self.write_generation = 0
 
     async def __aenter__(self) -> 'ApprovalDB':
-        self._conn = await aiosqlite.connect(self.db_file)
-        self._cursor = await self._conn.cursor()
-        logger.info("Соединение установлено.")
+        await self.open_pool()
         return self
 
     async def __aexit__(self, exc_type: any, exc_val: any, exc_tb: any) -> bool:
-        if exc_type:
-            logger.error(f"Произошла ошибка: {exc_type}; {exc_val}; {exc_tb}")
-        if self._conn:
-            await self._conn.close()
-            logger.info("Соединение разъединено.")
-        return True
-
-    async def create_table(self) -> None:
-        """Создает таблицу 'approvals', если она еще не существует."""
-        async with self:
-            await self._cursor.execute(
-                'SELECT name FROM sqlite_master WHERE type="table" AND name="approvals";'
-            )
-            table_exists = await self._cursor.fetchone()
-
-            if not table_exists:
-                try:
-                    await self._cursor.execute(
-                        """CREATE TABLE IF NOT EXISTS approvals
-                                                  (id INTEGER PRIMARY KEY, 
-                                                   amount REAL, 
-                                                   expense_item TEXT, 
-                                                   expense_group TEXT, 
-                                                   partner TEXT, 
-                                                   comment TEXT,
-                                                   period TEXT, 
-                                                   payment_method TEXT, 
-                                                   approvals_needed INTEGER, 
-                                                   approvals_received INTEGER,
-                                                   status TEXT,
-                                                   approved_by TEXT,
-                                                   initiator_id INTEGER)"""
-                    )
-                    await self._conn.commit()
-                    logger.info('Таблица "approvals" создана.')
-                except Exception as e:
-                    raise RuntimeError(e)
-            else:
-                logger.info('Таблица "approvals" уже существует.')
+        # исключения не подавляются: их записывает в лог и показывает пользователю error_callback
+        return False
+
+    async def _connect(self) -> aiosqlite.Connection:
+        """Открывает соединение и применяет к нему PRAGMAS."""
+        conn = await aiosqlite.connect(self.db_file)
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        return conn
 
+    async def open_pool(self) -> None:
+        """Открывает пул соединений, если он ещё не открыт."""
+        if self._pool is not None or self.pool_size <= 0:
+            return
+        async with self._pool_lock:
+            if self._pool is not None:
+                return
+            pool = asyncio.Queue(maxsize=self.pool_size)
+            for _ in range(self.pool_size):
+                pool.put_nowait(await self._connect())
+            self._pool = pool
+            logger.info(f"Пул из {self.pool_size} соединений с базой данных открыт.")
 
-    async def insert_record(self, record: dict[str, any]) -> int:
+    async def initialize(self) -> None:
+        """Открывает пул соединений и один раз подготавливает схему базы данных."""
+        if self._initialized:
+            return
+        await self.open_pool()
+        await self.migrate()
+        self._initialized = True
+
+    async def close(self) -> None:
+        """Закрывает все соединения пула."""
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        for _ in range(self.pool_size):
+            conn = await pool.get()
+            await conn.close()
+        logger.info("Пул соединений с базой данных закрыт.")
+
+    @asynccontextmanager
+    async def _connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Выдаёт соединение на время одной операции."""
+        await self.open_pool()
+        if self._pool is None:
+            conn = await self._connect()
+            try:
+                yield conn
+            finally:
+                await conn.close()
+            return
+
+        pool = self._pool
+        conn = await pool.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            pool.put_nowait(conn)
+
+    def cache_info(self) -> dict[str, int]:
+        """Счётчики попаданий и промахов кэша записей."""
+        return self._cache.info()
+
+    async def migrate(self) -> int:
+        """Применяет к базе данных недостающие миграции схемы и возвращает её версию."""
+        async with self._connection() as conn:
+            return await migrate(conn)
+
+    async def _execute_returning(self, conn: aiosqlite.Connection, query: str, params: list,
+                                 row_id: int | None = None) -> ApprovalRecord | None:
         """
-        Добавляет новую запись в таблицу 'approvals'.
+        Выполняет INSERT или UPDATE одной записи и возвращает её новое состояние.
+        На SQLite >= 3.35 это один запрос с RETURNING, на более старых версиях запись дочитывается
+        в той же транзакции. Фиксацию транзакции выполняет вызывающий код.
+        """
+        if SUPPORTS_RETURNING:
+            cursor = await conn.execute(f"{query} RETURNING {SELECT_COLUMNS}", params)
+            cursor.row_factory = ApprovalRecord.from_row
+            return await cursor.fetchone()
+
+        await conn.execute("BEGIN IMMEDIATE")
+        cursor = await conn.execute(query, params)
+        if not cursor.rowcount:
+            return None
+        cursor = await conn.execute(
+            f"SELECT {SELECT_COLUMNS} FROM approvals WHERE id=?", (row_id or cursor.lastrowid,)
+        )
+        cursor.row_factory = ApprovalRecord.from_row
+        return await cursor.fetchone()
+
+    async def insert_record(self, record: dict[str, any]) -> ApprovalRecord:
+        """
+        Добавляет новую запись в таблицу 'approvals' и возвращает её.
         """
 
         try:
-            await self._cursor.execute(
-                "INSERT INTO approvals (amount, expense_item, expense_group, partner, comment, period, payment_method,"
-                "approvals_needed, approvals_received, status, approved_by, initiator_id) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
-                list(record.values()),
-            )
-            await self._conn.commit()
+            async with self._connection() as conn:
+                inserted = await self._execute_returning(
+                    conn,
+                    "INSERT INTO approvals ({}, created_at) VALUES ({}, CURRENT_TIMESTAMP)".format(
+                        ", ".join(record.keys()), ", ".join("?" * len(record))
+                    ),
+                    list(record.values()),
+                )
+                await conn.commit()
+            self.write_generation += 1
+            self._cache.put(inserted.id, inserted)
             logger.info("Информация о счёте успешно добавлена.")
-            return self._cursor.lastrowid
+            return inserted
         except Exception as e:
             raise RuntimeError(f"Не удалось добавить информацию о счёте: {e}")
 
-    async def get_row_by_id(self, row_id: int) -> dict[str, any] | None:
-        """Получаем словарь из названий и значений столбцов по id"""
+    async def get_row_by_id(self, row_id: int) -> ApprovalRecord | None:
+        """Получаем запись о счёте по id, при наличии - из кэша, если счёт не найден - из архива"""
         try:
-            result = await self._cursor.execute(
-                "SELECT * FROM approvals WHERE id=?", (row_id,)
-            )
-            row = await result.fetchone()
-            if row is None:
+            row_id = int(row_id)
+            cached = self._cache.get(row_id)
+            if cached is not None:
+                return cached
+            generation = self._cache.generation
+            async with self._connection() as conn:
+                cursor = await conn.execute(
+                    f"SELECT {SELECT_COLUMNS} FROM approvals WHERE id=? "
+                    f"UNION ALL SELECT {SELECT_COLUMNS} FROM approvals_archive WHERE id=? LIMIT 1",
+                    (row_id, row_id),
+                )
+                cursor.row_factory = ApprovalRecord.from_row
+                record = await cursor.fetchone()
+            if record is None:
                 return None
+            self._cache.put_if_current(row_id, record, generation)
             logger.info("Данные строки получены успешно.")
-            return dict(
-                zip(
-                    (
-                        "id",
-                        "amount",
-                        "expense_item",
-                        "expense_group",
-                        "partner",
-                        "comment",
-                        "period",
-                        "payment_method",
-                        "approvals_needed",
-                        "approvals_received",
-                        "status",
-                        "approved_by",
-                        "initiator_id"
-                    ),
-                    row,
-                )
-            )
+            return record
         except Exception as e:
             raise RuntimeError(f"Не удалось получить запись: {e}")
 
@@ -112,51 +264,231 @@ class ApprovalDB:
         """Функция меняет значения столбцов.
         :param принимает id строки row_id и словарь updates из названий и значений столбцов"""
         try:
-            await self._cursor.execute(
-                "UPDATE approvals SET {} WHERE id = ?".format(
-                    ", ".join([f"{key} = ?" for key in updates.keys()])
-                ),
-                list(updates.values()) + [row_id],
-            )
-            await self._conn.commit()
+            async with self._connection() as conn:
+                await conn.execute(
+                    "UPDATE approvals SET {} WHERE id = ?".format(
+                        ", ".join([f"{key} = ?" for key in updates.keys()])
+                    ),
+                    list(updates.values()) + [row_id],
+                )
+                await conn.commit()
+            self.write_generation += 1
+            self._cache.invalidate(int(row_id))
             logger.info("Информация о счёте успешно обновлена.")
         except Exception as e:
             raise RuntimeError(f"Не удалось обновить информацию о счёте: {e}. ID заявки: {row_id}, "
                                f"Обновления: {updates}")
 
-    async def find_not_paid(self) -> list[dict[str, str]]:
-        """Функция возвращает все данные по всем неоплаченным заявкам на платёж"""
-        try:
-            result = await self._cursor.execute(
-                "SELECT * FROM approvals WHERE status != ? AND status != ?",
-                ("Paid", "Rejected"),
+    async def transition(self, row_id: int, from_statuses: Iterable[str], to_status: str,
+                         append_approver: str | None = None,
+                         updates: dict[str, any] | None = None,
+                         enqueue_sheets_write: bool = False) -> ApprovalRecord | None:
+        """Атомарно переводит счёт из одного из статусов from_statuses в статус to_status.
+        :param append_approver: апрувер, дописываемый через запятую в столбец approved_by
+        :param updates: словарь из названий и значений столбцов, меняемых вместе со статусом
+        :param enqueue_sheets_write: в той же транзакции поставить счёт в очередь записи в Google Sheets
+        :return: обновлённая запись или None, если счёт не найден или уже обработан"""
+        from_statuses = tuple(from_statuses)
+        assignments, params = ["status = ?"], [to_status]
+        if append_approver:
+            assignments.append(
+                "approved_by = CASE WHEN approved_by IS NULL OR approved_by = '' "
+                "THEN ? ELSE approved_by || ', ' || ? END"
             )
-            rows = await result.fetchall()
-            if not rows:
-                return []
-            logger.info("Неоплаченные счета найдены успешно.")
-
-            return [
-                dict(
-                    zip(
-                        (
-                            "id заявки",
-                            "сумма",
-                            "статья",
-                            "группа",
-                            "партнёр",
-                            "комментарий",
-                            "период дат",
-                            "способ оплаты",
-                            "апрувов требуется",
-                            "апрувов получено",
-                            "статус",
-                            "кто апрувил"
-                        ),
-                        row,
+            params += [append_approver, append_approver]
+        for key, value in (updates or {}).items():
+            assignments.append(f"{key} = ?")
+            params.append(value)
+        params += [row_id, *from_statuses]
+        query = "UPDATE approvals SET {} WHERE id = ? AND status IN ({})".format(
+            ", ".join(assignments), ", ".join("?" * len(from_statuses))
+        )
+        try:
+            async with self._connection() as conn:
+                record = await self._execute_returning(conn, query, params, row_id)
+                if record is not None and enqueue_sheets_write:
+                    await conn.execute(
+                        "INSERT INTO sheets_outbox (row_id, next_attempt_at) VALUES (?, ?)",
+                        (record.id, time.time()),
+                    )
+                await conn.commit()
+        except Exception as e:
+            raise RuntimeError(f"Не удалось изменить статус счёта: {e}. ID заявки: {row_id}, "
+                               f"Новый статус: {to_status}")
+        if record is None:
+            self._cache.invalidate(int(row_id))
+            logger.info(f"Счёт №{row_id} не найден или уже обработан.")
+            return None
+        self.write_generation += 1
+        self._cache.invalidate(record.id)
+        self._cache.put(record.id, record)
+        logger.info(f'Статус счёта №{row_id} изменён на "{to_status}".')
+        return record
+
+    async def save_message_refs(self, row_id: int, stage: str, refs: list[tuple[int, int]]) -> None:
+        """Сохраняет пары (chat_id, message_id) сообщений, отправленных по счёту на этапе stage."""
+        if not refs:
+            return
+        try:
+            async with self._connection() as conn:
+                await conn.executemany(
+                    "INSERT INTO message_refs (row_id, stage, chat_id, message_id) VALUES (?,?,?,?)",
+                    [(row_id, stage, chat_id, message_id) for chat_id, message_id in refs],
+                )
+                await conn.commit()
+        except Exception as e:
+            raise RuntimeError(f"Не удалось сохранить сообщения по счёту: {e}. ID заявки: {row_id}, этап: {stage}")
+
+    async def pop_message_refs(self, row_id: int, stage: str) -> list[tuple[int, int]]:
+        """Удаляет и возвращает пары (chat_id, message_id) сообщений, отправленных по счёту на этапе stage."""
+        query = "DELETE FROM message_refs WHERE row_id = ? AND stage = ?"
+        try:
+            async with self._connection() as conn:
+                if SUPPORTS_RETURNING:
+                    cursor = await conn.execute(f"{query} RETURNING chat_id, message_id", (row_id, stage))
+                    refs = await cursor.fetchall()
+                else:
+                    await conn.execute("BEGIN IMMEDIATE")
+                    cursor = await conn.execute(
+                        "SELECT chat_id, message_id FROM message_refs WHERE row_id = ? AND stage = ?",
+                        (row_id, stage),
+                    )
+                    refs = await cursor.fetchall()
+                    await conn.execute(query, (row_id, stage))
+                await conn.commit()
+            return [tuple(ref) for ref in refs]
+        except Exception as e:
+            raise RuntimeError(f"Не удалось получить сообщения по счёту: {e}. ID заявки: {row_id}, этап: {stage}")
+
+    async def archive_processed(self, older_than_days: int, batch_size: int = MAX_ARCHIVE_BATCH_SIZE) -> int:
+        """
+        Переносит оплаченные и отклонённые счета, созданные более older_than_days дней назад,
+        в таблицу 'approvals_archive'. Счета без даты создания (созданные до её появления) считаются старыми.
+        Перенос идёт пакетами по batch_size записей, каждый пакет в своей короткой транзакции,
+        чтобы не блокировать обработчики бота. Возвращает количество перенесённых счетов.
+        """
+        batch_size = min(batch_size, MAX_ARCHIVE_BATCH_SIZE)
+        archived = 0
+        try:
+            while True:
+                async with self._connection() as conn:
+                    await conn.execute("BEGIN IMMEDIATE")
+                    cursor = await conn.execute(
+                        "SELECT id FROM approvals WHERE status IN ('Paid', 'Rejected') "
+                        "AND (created_at IS NULL OR created_at < datetime('now', ?)) ORDER BY id LIMIT ?",
+                        (f"-{older_than_days} days", batch_size),
                     )
+                    ids = [row_id for row_id, in await cursor.fetchall()]
+                    if ids:
+                        placeholders = ", ".join("?" * len(ids))
+                        await conn.execute(
+                            f"INSERT INTO approvals_archive ({SELECT_COLUMNS}, archived_at) "
+                            f"SELECT {SELECT_COLUMNS}, CURRENT_TIMESTAMP FROM approvals WHERE id IN ({placeholders})",
+                            ids,
+                        )
+                        await conn.execute(f"DELETE FROM approvals WHERE id IN ({placeholders})", ids)
+                        await conn.execute(f"DELETE FROM message_refs WHERE row_id IN ({placeholders})", ids)
+                    await conn.commit()
+                self.write_generation += 1
+                for row_id in ids:
+                    self._cache.invalidate(row_id)
+                archived += len(ids)
+                if len(ids) < batch_size:
+                    break
+                # отдаём соединения и цикл событий обработчикам между пакетами
+                await asyncio.sleep(0)
+        except Exception as e:
+            raise RuntimeError(f"Не удалось перенести счета в архив: {e}. Перенесено: {archived}")
+        if archived:
+            logger.info(f"В архив перенесено счетов: {archived}.")
+        return archived
+
+    async def fetch_due_sheets_writes(self, limit: int) -> list[SheetsWrite]:
+        """Возвращает до limit заданий очереди записи в Google Sheets, срок которых наступил."""
+        try:
+            async with self._connection() as conn:
+                cursor = await conn.execute(
+                    "SELECT id, row_id, attempts, created_at FROM sheets_outbox WHERE next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at, id LIMIT ?",
+                    (time.time(), limit),
+                )
+                return [SheetsWrite(*row) for row in await cursor.fetchall()]
+        except Exception as e:
+            raise RuntimeError(f"Не удалось получить очередь записи в Google Sheets: {e}")
+
+    async def next_sheets_write_at(self) -> float | None:
+        """Время (unix) ближайшего задания очереди записи в Google Sheets или None, если очередь пуста."""
+        try:
+            async with self._connection() as conn:
+                cursor = await conn.execute("SELECT MIN(next_attempt_at) FROM sheets_outbox")
+                (next_attempt_at,) = await cursor.fetchone()
+                return next_attempt_at
+        except Exception as e:
+            raise RuntimeError(f"Не удалось получить очередь записи в Google Sheets: {e}")
+
+    async def complete_sheets_writes(self, write_ids: list[int]) -> None:
+        """Удаляет выполненные задания из очереди записи в Google Sheets."""
+        if not write_ids:
+            return
+        try:
+            async with self._connection() as conn:
+                await conn.execute(
+                    f"DELETE FROM sheets_outbox WHERE id IN ({', '.join('?' * len(write_ids))})", write_ids
+                )
+                await conn.commit()
+        except Exception as e:
+            raise RuntimeError(f"Не удалось удалить задания из очереди записи в Google Sheets: {e}")
+
+    async def reschedule_sheets_write(self, write_id: int, delay: float, error: str) -> None:
+        """Откладывает задание очереди записи в Google Sheets на delay секунд после ошибки."""
+        try:
+            async with self._connection() as conn:
+                await conn.execute(
+                    "UPDATE sheets_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? "
+                    "WHERE id = ?",
+                    (time.time() + delay, error, write_id),
+                )
+                await conn.commit()
+        except Exception as e:
+            raise RuntimeError(f"Не удалось отложить задание записи в Google Sheets: {e}")
+
+    async def find_not_paid_page(self, after_id: int | None = None, before_id: int | None = None,
+                                 status: str | None = None, initiator_id: int | None = None,
+                                 limit: int = NOT_PAID_PAGE_SIZE) -> tuple[list[ApprovalRecord], bool]:
+        """
+        Страница неоплаченных заявок по возрастанию id: следующая за after_id или предыдущая перед before_id,
+        при необходимости только со статусом status и инициатором initiator_id.
+        :return: записи страницы и признак того, что в направлении листания есть ещё записи
+        """
+        # условие по статусу записано литералами, чтобы совпасть с частичным индексом
+        conditions = ["status NOT IN ('Paid', 'Rejected')"]
+        params = []
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        else:
+            conditions.append("id > ?")
+            params.append(after_id or 0)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if initiator_id is not None:
+            conditions.append("initiator_id = ?")
+            params.append(initiator_id)
+        order = "DESC" if before_id is not None else "ASC"
+        try:
+            async with self._connection() as conn:
+                cursor = await conn.execute(
+                    f"SELECT {SELECT_COLUMNS} FROM approvals WHERE {' AND '.join(conditions)} "
+                    f"ORDER BY id {order} LIMIT ?",
+                    (*params, limit + 1),
                 )
-                for row in rows
-            ]
+                cursor.row_factory = ApprovalRecord.from_row
+                records = await cursor.fetchall()
         except Exception as e:
-            raise RuntimeError(f"Не удалось получить неоплаченные счета: {e}")
\ No newline at end of file
+            raise RuntimeError(f"Не удалось получить неоплаченные счета: {e}")
+        has_more = len(records) > limit
+        records = records[:limit]
+        if before_id is not None:
+            records.reverse()
+        return records, has_more
@@ -0,0 +1,107 @@
+import aiosqlite
+
+from config.logging_config import logger
+
+# Миграции схемы по порядку: миграция с индексом i переводит базу с версии i на версию i + 1.
+# Текущая версия схемы хранится в PRAGMA user_version. Уже выпущенные миграции не меняются,
+# изменения схемы добавляются новой миграцией в конец списка.
+MIGRATIONS: tuple[tuple[str, ...], ...] = (
+    # 1: исходная схема. IF NOT EXISTS - для баз, созданных до появления миграций
+    (
+        """CREATE TABLE IF NOT EXISTS approvals
+                                  (id INTEGER PRIMARY KEY,
+                                   amount REAL,
+                                   expense_item TEXT,
+                                   expense_group TEXT,
+                                   partner TEXT,
+                                   comment TEXT,
+                                   period TEXT,
+                                   payment_method TEXT,
+                                   approvals_needed INTEGER,
+                                   approvals_received INTEGER,
+                                   status TEXT,
+                                   approved_by TEXT,
+                                   initiator_id INTEGER)""",
+        "CREATE INDEX IF NOT EXISTS idx_approvals_not_paid ON approvals (id) "
+        "WHERE status NOT IN ('Paid', 'Rejected')",
+        """CREATE TABLE IF NOT EXISTS message_refs
+                                  (row_id INTEGER NOT NULL,
+                                   stage TEXT NOT NULL,
+                                   chat_id INTEGER NOT NULL,
+                                   message_id INTEGER NOT NULL)""",
+        "CREATE INDEX IF NOT EXISTS idx_message_refs_row_stage ON message_refs (row_id, stage)",
+    ),
+    # 2: дата создания счёта и индексы по статусу и инициатору.
+    # ADD COLUMN без значения по умолчанию меняет только схему и не переписывает строки,
+    # у ранее созданных счетов created_at остаётся NULL
+    (
+        "ALTER TABLE approvals ADD COLUMN created_at TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_approvals_status ON approvals (status)",
+        "CREATE INDEX IF NOT EXISTS idx_approvals_initiator ON approvals (initiator_id)",
+    ),
+    # 3: архив оплаченных и отклонённых счетов
+    (
+        """CREATE TABLE IF NOT EXISTS approvals_archive
+                                  (id INTEGER PRIMARY KEY,
+                                   amount REAL,
+                                   expense_item TEXT,
+                                   expense_group TEXT,
+                                   partner TEXT,
+                                   comment TEXT,
+                                   period TEXT,
+                                   payment_method TEXT,
+                                   approvals_needed INTEGER,
+                                   approvals_received INTEGER,
+                                   status TEXT,
+                                   approved_by TEXT,
+                                   initiator_id INTEGER,
+                                   created_at TEXT,
+                                   archived_at TEXT)""",
+    ),
+    # 4: очередь записи оплаченных счетов в Google Sheets
+    (
+        """CREATE TABLE IF NOT EXISTS sheets_outbox
+                                  (id INTEGER PRIMARY KEY,
+                                   row_id INTEGER NOT NULL,
+                                   attempts INTEGER NOT NULL DEFAULT 0,
+                                   next_attempt_at REAL NOT NULL,
+                                   last_error TEXT,
+                                   created_at TEXT DEFAULT CURRENT_TIMESTAMP)""",
+        "CREATE INDEX IF NOT EXISTS idx_sheets_outbox_next_attempt ON sheets_outbox (next_attempt_at)",
+    ),
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def get_schema_version(conn: aiosqlite.Connection) -> int:
+    """Возвращает текущую версию схемы базы данных"""
+    cursor = await conn.execute("PRAGMA user_version")
+    (version,) = await cursor.fetchone()
+    return version
+
+
+async def migrate(conn: aiosqlite.Connection) -> int:
+    """
+    Применяет недостающие миграции в одной транзакции и возвращает итоговую версию схемы.
+    Повторный вызов на актуальной базе ничего не меняет.
+    """
+    if await get_schema_version(conn) >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+
+    # версия перечитывается под блокировкой на случай одновременного запуска нескольких процессов
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = await get_schema_version(conn)
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                await conn.execute(statement)
+            logger.info(f"Применена миграция базы данных №{number}.")
+        await conn.execute(f"PRAGMA user_version = {max(version, SCHEMA_VERSION)}")
+        await conn.commit()
+    except Exception as e:
+        await conn.rollback()
+        raise RuntimeError(f"Не удалось применить миграции базы данных: {e}")
+
+    logger.info(f"Версия схемы базы данных: {max(version, SCHEMA_VERSION)}.")
+    return max(version, SCHEMA_VERSION)
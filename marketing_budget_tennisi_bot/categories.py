@@ -0,0 +1,134 @@
+from bisect import bisect_left
+
+CATEGORY_COLUMNS = ("Статья", "Группа", "Партнер")
+
+CategoryKey = tuple[str, str, str]
+
+
+def category_keys(records: list[dict]) -> list[CategoryKey]:
+    """
+    Тройки (статья, группа, партнёр) из строк листа "категории" в порядке первого появления.
+    Строки с пустой статьёй, группой или партнёром пропускаются, повторы учитываются один раз.
+    """
+
+    keys = []
+    seen = set()
+    category_column, group_column, partner_column = CATEGORY_COLUMNS
+    for row in records:
+        category = str(row.get(category_column, "")).strip()
+        group = str(row.get(group_column, "")).strip()
+        partner = str(row.get(partner_column, "")).strip()
+        if not (category and group and partner):
+            continue
+        key = (category, group, partner)
+        if key in seen:
+            continue
+        seen.add(key)
+        keys.append(key)
+    return keys
+
+
+def build_category_tree(records: list[dict]) -> tuple[dict[str, dict[str, list[str]]], list[str]]:
+    """
+    Построение дерева Статья → Группа → Партнер из строк листа "категории" за один проход.
+    Порядок статей, групп и партнёров совпадает с порядком их первого появления в листе.
+    :return: дерево и список статей
+    """
+
+    return tree_from_keys(category_keys(records))
+
+
+def tree_from_keys(keys: list[CategoryKey]) -> tuple[dict[str, dict[str, list[str]]], list[str]]:
+    """Дерево категорий и список статей из троек (статья, группа, партнёр)"""
+
+    data_structure = {}
+    for category, group, partner in keys:
+        data_structure.setdefault(category, {}).setdefault(group, []).append(partner)
+
+    return data_structure, list(data_structure)
+
+
+def apply_category_diff(tree: dict[str, dict[str, list[str]]], removed: set[CategoryKey],
+                        added: list[CategoryKey]) -> dict[str, dict[str, list[str]]]:
+    """
+    Новое дерево категорий с удалёнными removed и добавленными в конец added партнёрами.
+    Исходное дерево не меняется: копируются только затронутые статьи и группы,
+    поэтому диалоги, начатые со старым деревом, продолжают работать с ним.
+    """
+
+    new_tree = dict(tree)
+    copied_groups = set()
+
+    def partners(category: str, group: str) -> list[str]:
+        groups = new_tree.get(category, {})
+        if groups is tree.get(category):
+            groups = new_tree[category] = dict(groups)
+        elif category not in new_tree:
+            new_tree[category] = groups
+        if (category, group) not in copied_groups:
+            groups[group] = list(groups.get(group, ()))
+            copied_groups.add((category, group))
+        return groups[group]
+
+    for category, group, partner in removed:
+        partners(category, group).remove(partner)
+    for category, group, partner in added:
+        partners(category, group).append(partner)
+
+    for category, group in copied_groups:
+        groups = new_tree.get(category)
+        if groups is not None and not groups.get(group, True):
+            del groups[group]
+            if not groups:
+                del new_tree[category]
+    return new_tree
+
+
+class PrefixIndex:
+    """
+    Регистронезависимый поиск по началу любого слова названия: отсортированный список
+    (слово и остаток названия, позиция названия) и bisect вместо перебора всех названий.
+    """
+
+    def __init__(self, names: list[str]):
+        keys = set()
+        for position, name in enumerate(names):
+            words = name.casefold().split()
+            keys.update((" ".join(words[start:]), position) for start in range(len(words)))
+        self._keys = sorted(keys)
+
+    def search(self, prefix: str) -> list[int]:
+        """Позиции названий, одно из слов которых начинается с prefix, в исходном порядке."""
+
+        prefix = " ".join(prefix.casefold().split())
+        positions = set()
+        for i in range(bisect_left(self._keys, (prefix,)), len(self._keys)):
+            key, position = self._keys[i]
+            if not key.startswith(prefix):
+                break
+            positions.add(position)
+        return sorted(positions)
+
+
+class CategoryIndex:
+    """
+    Индексы поиска для одного снимка дерева категорий: по статьям, группам статьи
+    и партнёрам группы. Каждый индекс строится при первом поиске и используется всеми диалогами.
+    """
+
+    def __init__(self, tree: dict[str, dict[str, list[str]]]):
+        self.tree = tree
+        self._indexes: dict[tuple[str, ...], PrefixIndex] = {}
+
+    def names(self, path: tuple[str, ...]) -> list[str]:
+        """Статьи для пути (), группы для (статья,) и партнёры для (статья, группа)."""
+
+        node = self.tree
+        for name in path:
+            node = node[name]
+        return list(node)
+
+    def search(self, path: tuple[str, ...], prefix: str) -> list[int]:
+        if path not in self._indexes:
+            self._indexes[path] = PrefixIndex(self.names(path))
+        return self._indexes[path].search(prefix)
@@ -1,13 +1,15 @@
 import re
 from datetime import datetime
+from math import ceil
 
-from telegram import Update, ForceReply, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, ForceReply, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.error import BadRequest
 from telegram.ext import ConversationHandler, ContextTypes
 
 from config.config import Config
 from config.logging_config import logger
 from marketing_budget_tennisi_bot.handlers import submit_record_command
-from marketing_budget_tennisi_bot.sheets import GoogleSheetsManager
+from marketing_budget_tennisi_bot.sheets import category_cache
 
 (
     INPUT_SUM,
@@ -22,33 +24,131 @@ from marketing_budget_tennisi_bot.sheets import GoogleSheetsManager
 
 payment_types: list[str] = ["нал", "безнал", "крипта"]
 
+KEYBOARD_PAGE_SIZE = 8  # кнопок выбора на одной странице клавиатуры
 
-async def create_keyboard(massive: list[str]) -> InlineKeyboardMarkup:
-    """Функция для создания клавиатуры. Каждый кнопка создаётся с новой строки."""
+
+async def create_keyboard(massive: list[str], positions: list[int] | None = None, page: int = 0) -> InlineKeyboardMarkup:
+    """
+    Функция для создания клавиатуры. Каждый кнопка создаётся с новой строки.
+    Кнопки создаются для элементов massive с номерами positions (по умолчанию для всех), callback_data кнопки —
+    номер элемента в massive. Если кнопок больше KEYBOARD_PAGE_SIZE, показывается страница page
+    и строка с кнопками листания "page_<номер страницы>".
+    """
+
+    if positions is None:
+        positions = range(len(massive))
+    pages = max(1, ceil(len(positions) / KEYBOARD_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    start = page * KEYBOARD_PAGE_SIZE
 
     keyboard = []
-    for number, item in enumerate(massive):
-        button = InlineKeyboardButton(item, callback_data=number)
+    for number in positions[start:start + KEYBOARD_PAGE_SIZE]:
+        button = InlineKeyboardButton(massive[number], callback_data=number)
         keyboard.append([button])
 
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀️", callback_data=f"page_{page - 1}"))
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f"page_{page}"))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("▶️", callback_data=f"page_{page + 1}"))
+        keyboard.append(navigation)
+
     return InlineKeyboardMarkup(keyboard)
 
 
+async def options_keyboard(context: ContextTypes.DEFAULT_TYPE) -> InlineKeyboardMarkup:
+    """Клавиатура текущего шага выбора статьи, группы или партнёра с учётом введённого фильтра."""
+
+    keyboard = context.user_data["keyboard"]
+    names = context.user_data[keyboard["list"]]
+    positions = None
+    if keyboard["filter"]:
+        positions = context.user_data["category_index"].search(keyboard["path"], keyboard["filter"])
+    markup = await create_keyboard(names, positions, keyboard["page"])
+    if keyboard["filter"]:
+        reset = InlineKeyboardButton("✖️ Сбросить поиск", callback_data="page_reset")
+        markup = InlineKeyboardMarkup([*markup.inline_keyboard, [reset]])
+    return markup
+
+
+async def send_options_keyboard(message: Message, context: ContextTypes.DEFAULT_TYPE, text: str, list_key: str,
+                                path: tuple[str, ...]) -> None:
+    """
+    Отправка клавиатуры выбора из списка context.user_data[list_key] по пути path в дереве категорий.
+    Длинные списки листаются по страницам, а введённый текст фильтрует варианты (см. filter_options).
+    """
+
+    if len(context.user_data[list_key]) > KEYBOARD_PAGE_SIZE:
+        text = f"{text}\nИли начните вводить название, чтобы найти нужный вариант."
+    context.user_data["keyboard"] = {"list": list_key, "path": path, "text": text, "filter": "", "page": 0}
+    bot_message = await message.reply_text(text, reply_markup=await options_keyboard(context))
+    context.user_data["keyboard"]["message_id"] = bot_message.message_id
+
+
+async def update_options_keyboard(context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    """Замена текста и клавиатуры сообщения выбора на текущую страницу и фильтр."""
+
+    keyboard = context.user_data["keyboard"]
+    try:
+        await context.bot.edit_message_text(
+            text,
+            chat_id=context.user_data["chat_id"],
+            message_id=keyboard["message_id"],
+            reply_markup=await options_keyboard(context),
+        )
+    except BadRequest as e:
+        if "not modified" not in str(e):
+            raise
+
+
+async def turn_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик кнопок листания и сброса поиска клавиатуры выбора статьи, группы или партнёра."""
+
+    query = update.callback_query
+    await query.answer()
+    keyboard = context.user_data["keyboard"]
+    page = query.data.removeprefix("page_")
+    if page == "reset":
+        keyboard["filter"], keyboard["page"] = "", 0
+        await update_options_keyboard(context, keyboard["text"])
+        return
+    if int(page) == keyboard["page"]:
+        return
+    keyboard["page"] = int(page)
+    await query.edit_message_reply_markup(reply_markup=await options_keyboard(context))
+
+
+async def filter_options(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик ввода текста на шаге выбора: оставляет варианты, одно из слов которых начинается с текста."""
+
+    keyboard = context.user_data["keyboard"]
+    keyboard["filter"], keyboard["page"] = update.message.text.strip(), 0
+    await update.message.from_user.delete_message(update.message.message_id)
+
+    found = len(context.user_data["category_index"].search(keyboard["path"], keyboard["filter"]))
+    if found:
+        text = f"{keyboard['text']}\nНайдено по «{keyboard['filter']}»: {found}"
+    else:
+        text = f"{keyboard['text']}\nПо «{keyboard['filter']}» ничего не найдено, введите другое название."
+    await update_options_keyboard(context, text)
+
+
 async def enter_record(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Начало диалога. Ввод суммы и получение данных о статьях, группах, партнёрах."""
 
     # получаем chat_id отправителя команды /enter_record;
     # проверяем входит ли он в белый список;
-    # авторизуемся в Google Sheets, сохраняем данные о статьях, группах, партнёрах из таблицы "категории"
+    # сохраняем данные о статьях, группах, партнёрах из таблицы "категории" (из кэша, см. CategoryCache)
 
     context.user_data["chat_id"] = update.effective_chat.id
     if context.user_data["chat_id"] not in Config.initiators_chat_ids:
         raise PermissionError("Команда запрещена! Вы не находитесь в списке инициаторов.")
 
-    manager = GoogleSheetsManager()
-    await manager.initialize_google_sheets()
-    options_dict, items = await manager.get_data()
+    options_dict, items = await category_cache.get()
     context.user_data["options"], context.user_data["items"] = options_dict, items
+    context.user_data["category_index"] = category_cache.index_for(options_dict)
 
     # отправляем сообщение "Введите сумму" от бота
 
@@ -90,11 +190,7 @@ async def input_sum(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # добавляем клавиатуру со статьями расхода и отправляем сообщение "Выберите статью ..." от бота
 
     await update.message.reply_text(f"Введена сумма: {user_sum}")
-    items = context.user_data["items"]
-    reply_markup = await create_keyboard(items)
-    await update.message.reply_text(
-        "Выберите статью расхода:", reply_markup=reply_markup
-    )
+    await send_options_keyboard(update.message, context, "Выберите статью расхода:", "items", ())
 
     return INPUT_ITEM
 
@@ -116,6 +212,7 @@ async def input_item(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     groups = list(context.user_data["options"].keys())
     context.user_data["groups"] = groups
     del context.user_data["items"]
+    del context.user_data["keyboard"]
 
     # если всего одна группа расхода - получаем данные о ней и переходим на этап выбора партнёра
     # если всего один партнёр - получаем данные о нём и переходим на этап ввода комментария
@@ -150,15 +247,12 @@ async def input_item(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
             return INPUT_COMMENT
 
-        reply_markup = await create_keyboard(context.user_data["partners"])
-        await query.message.reply_text("Выберите партнёра:", reply_markup=reply_markup)
+        await send_options_keyboard(query.message, context, "Выберите партнёра:", "partners",
+                                    (selected_item, selected_group))
 
         return INPUT_PARTNER
 
-    reply_markup = await create_keyboard(groups)
-    await query.message.reply_text(
-        "Выберите группу расхода:", reply_markup=reply_markup
-    )
+    await send_options_keyboard(query.message, context, "Выберите группу расхода:", "groups", (selected_item,))
 
     return INPUT_GROUP
 
@@ -176,6 +270,7 @@ async def input_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     context.user_data["partners"] = partners
     del context.user_data["options"]
     del context.user_data["groups"]
+    del context.user_data["keyboard"]
 
     if len(partners) == 1:
         selected_partner = context.user_data["partners"][0]
@@ -195,8 +290,8 @@ async def input_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
         return INPUT_COMMENT
 
-    reply_markup = await create_keyboard(context.user_data["partners"])
-    await query.message.reply_text("Выберите партнёра:", reply_markup=reply_markup)
+    await send_options_keyboard(query.message, context, "Выберите партнёра:", "partners",
+                                (context.user_data["item"], selected_group))
 
     return INPUT_PARTNER
 
@@ -211,6 +306,7 @@ async def input_partner(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
     context.user_data["partner"] = selected_partner
     del context.user_data["partners"]
+    del context.user_data["keyboard"]
 
     bot_message = await context.bot.send_message(
         chat_id=context.user_data["chat_id"],
@@ -0,0 +1,173 @@
+import asyncio
+import csv
+import random
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from gspread.cell import Cell
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+from marketing_budget_tennisi_bot.categories import CATEGORY_COLUMNS
+from marketing_budget_tennisi_bot.sheets_quota import QuotaExceeded
+
+
+class FakeSheetsError(RuntimeError):
+    """Сбой запроса, внесённый FakeSheetsBackend для проверки обработки ошибок."""
+
+
+class FakeSheetsBackend:
+    """
+    Локальная замена Google Sheets в памяти процесса для запуска бота и бенчмарков без сети.
+    Повторяет используемую ботом часть API gspread_asyncio: authorize, open_by_key,
+    get_worksheet_by_id, get_all_records, acell, append_row(s), format, batch_format и batch_update.
+    Каждый запрос выполняется с задержкой latency секунд, учитывается в calls и может завершиться
+    QuotaExceeded при превышении reads_per_minute/writes_per_minute (0 — без ограничений)
+    или FakeSheetsError с вероятностью failure_rate.
+    """
+
+    def __init__(self, latency: float = 0.0, reads_per_minute: int = 0, writes_per_minute: int = 0,
+                 failure_rate: float = 0.0, seed: int | None = None):
+        self.latency = latency
+        self.quotas = {"read": reads_per_minute, "write": writes_per_minute}
+        self.failure_rate = failure_rate
+        self.calls = Counter()
+        self.modified_at = datetime.now(timezone.utc)
+        self._requests = {"read": deque(), "write": deque()}
+        self._random = random.Random(seed)
+        self._spreadsheets: dict[str, FakeSpreadsheet] = {}
+        self._client = FakeSheetsClient(self)
+
+    def spreadsheet(self, key: str) -> "FakeSpreadsheet":
+        """Таблица по id; создаётся пустой при первом обращении."""
+
+        if key not in self._spreadsheets:
+            self._spreadsheets[key] = FakeSpreadsheet(self, key)
+        return self._spreadsheets[key]
+
+    async def authorize(self) -> "FakeSheetsClient":
+        return self._client
+
+    async def get_last_update_time(self, worksheet: "FakeWorksheet") -> str:
+        await self.request("read", "get_last_update_time")
+        return self.modified_at.isoformat()
+
+    async def request(self, kind: str, name: str) -> None:
+        """Имитация одного запроса к API: задержка, квота и внесённые сбои."""
+
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        quota = self.quotas.get(kind)
+        if quota:
+            now = time.monotonic()
+            requests = self._requests[kind]
+            while requests and now - requests[0] >= 60:
+                requests.popleft()
+            if len(requests) >= quota:
+                self.calls["quota_exceeded"] += 1
+                raise QuotaExceeded(f"FakeSheets: превышена квота {kind} ({quota} в минуту)")
+            requests.append(now)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.calls["failed"] += 1
+            raise FakeSheetsError(f"FakeSheets: внесённый сбой запроса {name}")
+        if kind == "write":
+            self.modified_at = datetime.now(timezone.utc)
+
+
+class FakeSheetsClient:
+    def __init__(self, backend: FakeSheetsBackend):
+        self.backend = backend
+
+    async def open_by_key(self, key: str) -> "FakeSpreadsheet":
+        await self.backend.request("read", "open_by_key")
+        return self.backend.spreadsheet(key)
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend: FakeSheetsBackend, key: str):
+        self.backend = backend
+        self.id = key
+        self._worksheets: dict[int, FakeWorksheet] = {}
+
+    def worksheet(self, sheet_id: int) -> "FakeWorksheet":
+        """Лист по id; создаётся пустым при первом обращении."""
+
+        sheet_id = int(sheet_id)
+        if sheet_id not in self._worksheets:
+            self._worksheets[sheet_id] = FakeWorksheet(self.backend, sheet_id)
+        return self._worksheets[sheet_id]
+
+    async def get_worksheet_by_id(self, sheet_id: int) -> "FakeWorksheet":
+        await self.backend.request("read", "get_worksheet_by_id")
+        return self.worksheet(sheet_id)
+
+
+class FakeWorksheet:
+    def __init__(self, backend: FakeSheetsBackend, sheet_id: int):
+        self.backend = backend
+        self.id = sheet_id
+        self.title = f"Лист{sheet_id}"
+        self.rows: list[list] = []
+        self.formats: list[dict] = []
+
+    async def get_all_records(self) -> list[dict]:
+        await self.backend.request("read", "get_all_records")
+        if not self.rows:
+            return []
+        header = self.rows[0]
+        return [dict(zip(header, row)) for row in self.rows[1:]]
+
+    async def acell(self, label: str, **kwargs) -> Cell:
+        await self.backend.request("read", "acell")
+        row, col = a1_to_rowcol(label)
+        values = self.rows[row - 1] if row <= len(self.rows) else []
+        return Cell(row, col, values[col - 1] if col <= len(values) else None)
+
+    async def append_row(self, values: list, **kwargs) -> dict:
+        return await self._append("append_row", [values])
+
+    async def append_rows(self, values: list[list], **kwargs) -> dict:
+        return await self._append("append_rows", values)
+
+    async def _append(self, name: str, values: list[list]) -> dict:
+        await self.backend.request("write", name)
+        first_row = len(self.rows) + 1
+        self.rows.extend(list(row) for row in values)
+        last_row = len(self.rows)
+        width = max((len(row) for row in values), default=1)
+        return {
+            "updates": {
+                "updatedRange": f"'{self.title}'!A{first_row}:{rowcol_to_a1(last_row, width)}",
+                "updatedRows": len(values),
+            }
+        }
+
+    async def format(self, ranges: str | list[str], format: dict) -> dict:
+        await self.backend.request("write", "format")
+        self.formats.append({"range": ranges, "format": format})
+        return {}
+
+    async def batch_format(self, formats: list[dict]) -> dict:
+        await self.backend.request("write", "batch_format")
+        self.formats.extend(formats)
+        return {}
+
+    async def batch_update(self, data: list[dict], **kwargs) -> dict:
+        await self.backend.request("write", "batch_update")
+        for update in data:
+            first_row, _ = a1_to_rowcol(update["range"].split("!")[-1].split(":")[0])
+            for offset, values in enumerate(update["values"]):
+                index = first_row - 1 + offset
+                self.rows.extend([] for _ in range(index + 1 - len(self.rows)))
+                self.rows[index] = list(values)
+        return {}
+
+
+def load_categories(worksheet: FakeWorksheet, path: str) -> None:
+    """Заполняет лист категорий строками CSV-файла с колонками Статья, Группа, Партнер."""
+
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.DictReader(file)
+        worksheet.rows = [list(CATEGORY_COLUMNS)]
+        worksheet.rows.extend([row.get(column, "") for column in CATEGORY_COLUMNS] for row in reader)
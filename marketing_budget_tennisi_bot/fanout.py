@@ -0,0 +1,104 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from telegram.error import RetryAfter, TimedOut
+
+from config.config import Config
+from config.logging_config import logger
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов к Bot API: не больше per_second запросов в секунду всего
+    и не больше per_chat_per_second в один чат. Каждый запрос заранее бронирует ближайшее
+    свободное время отправки, поэтому ожидающие запросы не выстраиваются за общей блокировкой.
+    """
+
+    def __init__(self, per_second: float, per_chat_per_second: float):
+        self.interval = 1 / per_second
+        self.chat_interval = 1 / per_chat_per_second
+        self._next_at = 0.0
+        self._chat_next_at: dict[int, float] = {}
+        self._deferred_until: dict[int, float] = {}
+
+    def reserve(self, chat_id: int) -> float:
+        """Бронирует время отправки в чат chat_id и возвращает, сколько секунд до него ждать."""
+
+        now = time.monotonic()
+        if len(self._chat_next_at) > 1000:
+            self._chat_next_at = {chat: at for chat, at in self._chat_next_at.items() if at > now}
+        at = max(now, self._next_at, self._chat_next_at.get(chat_id, 0.0))
+        self._next_at = at + self.interval
+        self._chat_next_at[chat_id] = at + self.chat_interval
+        return at - now
+
+    def defer(self, chat_id: int, delay: float) -> None:
+        """Откладывает отправки в чат chat_id на delay секунд (после RetryAfter)."""
+
+        until = time.monotonic() + delay
+        self._deferred_until[chat_id] = max(self._deferred_until.get(chat_id, 0.0), until)
+
+    async def wait(self, chat_id: int) -> None:
+        # отложенный чат ждёт до брони: иначе его далёкое время сдвинуло бы общую очередь
+        # и задержало рассылку в остальные чаты
+        while (deferred := self._deferred_until.get(chat_id, 0.0) - time.monotonic()) > 0:
+            await asyncio.sleep(deferred)
+        self._deferred_until.pop(chat_id, None)
+        delay = self.reserve(chat_id)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass(frozen=True, slots=True)
+class Delivery:
+    """Результат запроса к одному получателю: ответ Bot API или ошибка"""
+
+    chat_id: int
+    result: Any = None
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+rate_limiter = RateLimiter(Config.telegram_messages_per_second, Config.telegram_chat_messages_per_second)
+_semaphore = asyncio.Semaphore(Config.telegram_fanout_concurrency)
+
+
+async def deliver(chat_id: int, request: Callable[[int], Awaitable[Any]], idempotent: bool = False) -> Delivery:
+    """
+    Выполнение request(chat_id) в пределах ограничений частоты. На RetryAfter запрос повторяется
+    до Config.telegram_send_attempts раз, остальные ошибки возвращаются в Delivery.
+    Таймаут повторяется только для идемпотентных запросов (idempotent=True, например
+    edit_message_text): отправка, завершившаяся таймаутом, могла дойти, и повтор её бы продублировал.
+    Ожидание очереди и паузы после RetryAfter проходят вне семафора: слот Config.telegram_fanout_concurrency
+    занимается только на время самого запроса.
+    """
+
+    for attempt in range(1, Config.telegram_send_attempts + 1):
+        await rate_limiter.wait(chat_id)
+        try:
+            async with _semaphore:
+                return Delivery(chat_id, result=await request(chat_id))
+        except RetryAfter as e:
+            if attempt == Config.telegram_send_attempts:
+                return Delivery(chat_id, error=e)
+            retry_after = getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()
+            logger.warning(f"Flood control Telegram для chat_id {chat_id}, повтор через {retry_after} с.")
+            # следующие отправки в этот чат, в том числе из других рассылок, ждут retry_after
+            rate_limiter.defer(chat_id, retry_after)
+        except TimedOut as e:
+            if not idempotent or attempt == Config.telegram_send_attempts:
+                return Delivery(chat_id, error=e)
+        except Exception as e:
+            return Delivery(chat_id, error=e)
+
+
+async def fan_out(chat_ids: list[int], request: Callable[[int], Awaitable[Any]],
+                  idempotent: bool = False) -> list[Delivery]:
+    """Параллельное выполнение request для каждого chat_id. Результаты в порядке chat_ids."""
+
+    return list(await asyncio.gather(*(deliver(chat_id, request, idempotent) for chat_id in chat_ids)))
@@ -1,15 +1,27 @@
+import asyncio
 import re
-import textwrap
 from datetime import datetime
+from typing import Awaitable
 
-from google.api_core.exceptions import NotFound
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from marketing_budget_tennisi_bot.sheets import add_record_to_google_sheet
+from marketing_budget_tennisi_bot.fanout import Delivery, deliver, fan_out
+from marketing_budget_tennisi_bot.outbox import sheets_outbox
+from marketing_budget_tennisi_bot.sheets import category_cache
 from config.config import Config
 from config.logging_config import logger
-from db import db
+from db import db, ApprovalRecord
+from db.cache import LRUCache
+
+SHOW_NOT_PAID_PAGE_SIZE = 5  # заявок на одной странице /show_not_paid
+NOT_PAID_RECORD_LENGTH = 4096 // SHOW_NOT_PAID_PAGE_SIZE - 2  # страница целиком помещается в одно сообщение
+NOT_PAID_STATUS_CODES = {"Not processed": "n", "Pending": "p", "Approved": "a"}
+DEPARTMENT_STATUSES = {"head": "Not processed", "finance": "Pending", "payers": "Approved"}
+
+# отрисованные страницы /show_not_paid, см. render_not_paid_page
+not_paid_pages: LRUCache[tuple[str, InlineKeyboardMarkup | None]] = LRUCache(Config.database_cache_size)
 
 
 async def chat_ids_department(department: str) -> list[int]:
@@ -127,14 +139,14 @@ async def submit_record_command(update: Update, context: ContextTypes.DEFAULT_TY
     }
     try:
         async with db:
-            row_id = await db.insert_record(record_dict)
+            record = await db.insert_record(record_dict)
     except Exception as e:
         raise RuntimeError(f"Произошла ошибка при добавлении счёта в базу данных. {e}")
 
-    await create_and_send_approval_message(row_id, record_dict, "head", context=context)
+    await create_and_send_approval_message(record.id, record, "head", context=context)
 
 
-async def create_and_send_approval_message(row_id: str | int, record_dict: dict, department: str,
+async def create_and_send_approval_message(row_id: str | int, record: ApprovalRecord, department: str,
                                            context: ContextTypes.DEFAULT_TYPE) -> None:
     """Создание кнопок "Одобрить" и "Отклонить", создание и отправка сообщения для одобрения заявки."""
 
@@ -155,10 +167,10 @@ async def create_and_send_approval_message(row_id: str | int, record_dict: dict,
     reply_markup = InlineKeyboardMarkup(keyboard)
     message_text = (
         f"Пожалуйста, одобрите запрос на платёж {row_id}. \nДанные платежа:\n"
-        f'сумма: {record_dict["amount"]}\nстатья: {record_dict["expense_item"]}\n'
-        f'группа: {record_dict["expense_group"]}\nпартнер: {record_dict["partner"]}\n'
-        f'период начисления: {record_dict["period"]}\nформа оплаты: {record_dict["payment_method"]}\n'
-        f'комментарий: {record_dict["comment"]}'
+        f'сумма: {record.amount}\nстатья: {record.expense_item}\n'
+        f'группа: {record.expense_group}\nпартнер: {record.partner}\n'
+        f'период начисления: {record.period}\nформа оплаты: {record.payment_method}\n'
+        f'комментарий: {record.comment}'
     )
 
     chat_ids_list = await chat_ids_department(department)
@@ -168,25 +180,65 @@ async def create_and_send_approval_message(row_id: str | int, record_dict: dict,
 async def send_message_and_save_data(context: ContextTypes.DEFAULT_TYPE,
                                      chat_ids_list: list[int], message_text: str,
                                      row_id: int | str, department: str = None,
-                                     reply_markup: InlineKeyboardMarkup = None):
-    """Отправка сообщения в выбранные телеграм-чаты."""
-
-    message_ids = []
-    actual_chat_ids = []
-    for chat_id in chat_ids_list:
-        try:
-            message = await context.bot.send_message(
-                chat_id=chat_id,
-                text=message_text,
-                reply_markup=reply_markup
-            )
-            message_ids.append(message.message_id)
-            actual_chat_ids.append(chat_id)
-        except Exception as e:
-            pass
+                                     reply_markup: InlineKeyboardMarkup = None) -> list[Delivery]:
+    """
+    Отправка сообщения в выбранные телеграм-чаты. Сообщения отправляются параллельно
+    с учётом ограничений Telegram, для каждого чата возвращается результат отправки.
+    """
 
+    deliveries = await fan_out(
+        chat_ids_list,
+        lambda chat_id: context.bot.send_message(chat_id=chat_id, text=message_text, reply_markup=reply_markup),
+    )
+    failed = {delivery.chat_id: str(delivery.error) for delivery in deliveries if not delivery.ok}
+    if failed:
+        logger.error(f"Сообщение о счёте №{row_id} ({department}) не доставлено: {failed}")
+
+    async with db:
+        await db.save_message_refs(
+            row_id, department, [(delivery.chat_id, delivery.result.message_id) for delivery in deliveries if delivery.ok]
+        )
+    return deliveries
 
-    context.bot_data[f"{row_id}_{department}"] = list(zip(actual_chat_ids, message_ids))
+
+async def close_stage(context: ContextTypes.DEFAULT_TYPE, row_id: int | str, stage: str,
+                      message_refs: list[tuple[int, int]], text: str,
+                      next_stage: Awaitable | None = None, update: Update | None = None) -> None:
+    """
+    Закрытие этапа согласования: сообщения этапа stage во всех чатах параллельно заменяются на text
+    без кнопок, одновременно с отправкой сообщений следующего этапа next_stage.
+    Если сообщений этапа не сохранилось, text отправляется ответом на update.
+    Ошибки изменения сообщений записываются в лог одним событием.
+    """
+
+    if message_refs:
+        message_ids = dict(message_refs)
+        edits = fan_out(
+            list(message_ids),
+            lambda chat_id: context.bot.edit_message_text(
+                chat_id=chat_id, message_id=message_ids[chat_id], text=text, reply_markup=InlineKeyboardMarkup([])
+            ),
+            idempotent=True,
+        )
+    elif update is not None:
+        edits = update.effective_message.reply_text(text)
+    else:
+        edits = None
+
+    results = await asyncio.gather(*(step for step in (edits, next_stage) if step is not None))
+    if message_refs:
+        failed = {delivery.chat_id: str(delivery.error) for delivery in results[0] if not delivery.ok}
+        if failed:
+            logger.error(f"Не удалось закрыть этап {stage} счёта №{row_id} ({len(failed)} из {len(message_refs)}): "
+                         f"{failed}")
+
+
+async def notify_initiator(context: ContextTypes.DEFAULT_TYPE, initiator_id: int | str, text: str) -> None:
+    """Отправка сообщения инициатору счёта с учётом ограничений Telegram."""
+
+    delivery = await deliver(int(initiator_id), lambda chat_id: context.bot.send_message(chat_id, text))
+    if not delivery.ok:
+        raise RuntimeError(f"Не удалось отправить сообщение инициатору {initiator_id}: {delivery.error}")
 
 
 async def approval_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -207,12 +259,10 @@ async def approval_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
     async with db:
         record = await db.get_row_by_id(row_id)
-        initiator_id = record.get("initiator_id")
-        amount = record.get("amount")
-        if not record:
-            raise RuntimeError("Запись в таблице с данным id не найдена.")
+    if not record:
+        raise RuntimeError("Запись в таблице с данным id не найдена.")
 
-    await approval_process(context, update, action, row_id, approver, department, amount, initiator_id)
+    await approval_process(context, update, action, row_id, approver, department, record.amount, record.initiator_id)
 
 
 async def approval_process(context: ContextTypes.DEFAULT_TYPE, update: Update, action: str,
@@ -239,30 +289,18 @@ async def approve_to_financial_dep(context: ContextTypes.DEFAULT_TYPE, update: U
     """
 
     async with db:
-        await db.update_row_by_id(
-            row_id,
-            {
-                "approvals_received": 1,
-                "status": "Pending",
-                "approved_by": approver,
-            },
+        record = await db.transition(
+            row_id, ("Not processed",), "Pending",
+            append_approver=approver, updates={"approvals_received": 1}
         )
-        record = await db.get_row_by_id(row_id)
-    if context.bot_data.get(f'{row_id}_head'):
-        for chat_id, message_id in context.bot_data.get(f"{row_id}_head"):
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    text="Запрос на одобрение отправлен в финансовый отдел.",
-                    reply_markup=InlineKeyboardMarkup([]),
-                )
-            except Exception as e:
-                logger.error(f"Не удалось обновить сообщение об апруве счёта с chat_id: {chat_id}: {e}")
-        del context.bot_data[f'{row_id}_head']
-    else:
-        await update.message.reply_text("Запрос на одобрение отправлен в финансовый отдел.")
-    await create_and_send_approval_message(row_id, record, "finance", context=context)
+        message_refs = await db.pop_message_refs(row_id, "head") if record else []
+    if record is None:
+        raise RuntimeError(f"Счёт №{row_id} уже обработан.")
+    await close_stage(
+        context, row_id, "head", message_refs, "Запрос на одобрение отправлен в финансовый отдел.",
+        next_stage=create_and_send_approval_message(row_id, record, "finance", context=context),
+        update=update,
+    )
 
 
 async def approve_to_payment_dep(context: ContextTypes.DEFAULT_TYPE, update: Update,
@@ -273,35 +311,23 @@ async def approve_to_payment_dep(context: ContextTypes.DEFAULT_TYPE, update: Upd
     Изменение сообщения от бота в чатах участников департамента "head" или "finance"
     """
 
+    from_statuses = {
+        "head": ("Not processed",),
+        "finance": ("Pending",),
+    }.get(department, ("Not processed", "Pending"))
     async with db:
-        record = await db.get_row_by_id(row_id)
-        approver_in_db = record.get("approved_by")
-        if approver_in_db:
-            approver = f"{approver_in_db}, {approver}"
-        await db.update_row_by_id(
-            row_id,
-            {
-                "approvals_received": 2 if department == "finance" else 1,
-                "status": "Approved",
-                "approved_by": f"{approver}",
-            },
+        record = await db.transition(
+            row_id, from_statuses, "Approved",
+            append_approver=approver, updates={"approvals_received": 2 if department == "finance" else 1}
         )
-        record = await db.get_row_by_id(row_id)
-    if context.bot_data.get(f'{row_id}_{department}'):
-        for chat_id, message_id in context.bot_data.get(f"{row_id}_{department}"):
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    text="Запрос на платеж одобрен. Счёт ожидает оплату.",
-                    reply_markup=InlineKeyboardMarkup([]),
-                )
-            except Exception as e:
-                logger.error(f"Не удалось обновить сообщение об апруве счёта с chat_id: {chat_id} {e}")
-        del context.bot_data[f'{row_id}_{department}']
-    else:
-        await update.message.reply_text("Запрос на платеж одобрен. Счёт ожидает оплату.")
-    await create_and_send_payment_message(row_id, record, context)
+        message_refs = await db.pop_message_refs(row_id, department) if record else []
+    if record is None:
+        raise RuntimeError(f"Счёт №{row_id} уже обработан.")
+    await close_stage(
+        context, row_id, department, message_refs, "Запрос на платеж одобрен. Счёт ожидает оплату.",
+        next_stage=create_and_send_payment_message(row_id, record, context),
+        update=update,
+    )
 
 
 async def reject_record(context: ContextTypes.DEFAULT_TYPE, update: Update,
@@ -309,28 +335,17 @@ async def reject_record(context: ContextTypes.DEFAULT_TYPE, update: Update,
     """Отправка сообщения об отклонении платежа и изменении статуса платежа."""
 
     async with db:
-        await db.update_row_by_id(
-            row_id, {"status": "Rejected"}
-        )
-    if context.bot_data.get(f'{row_id}_{department}'):
-        for chat_id, message_id in context.bot_data[f'{row_id}_{department}']:
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    text=f"Счёт №{row_id} отклонен.",
-                    reply_markup=InlineKeyboardMarkup([]),
-                )
-            except Exception as e:
-                logger.error(f"Не удалось обновить информацию об отклонении счёта с chat_id: {chat_id} {e}")
-        del context.bot_data[f'{row_id}_{department}']
-
-    await context.bot.send_message(
-        initiator_id, f"Счёт №{row_id} отклонен {approver}."
+        record = await db.transition(row_id, ("Not processed", "Pending"), "Rejected")
+        message_refs = await db.pop_message_refs(row_id, department) if record else []
+    if record is None:
+        raise RuntimeError(f"Счёт №{row_id} уже обработан.")
+    await close_stage(
+        context, row_id, department, message_refs, f"Счёт №{row_id} отклонен.",
+        next_stage=notify_initiator(context, initiator_id, f"Счёт №{row_id} отклонен {approver}."),
     )
 
 
-async def create_and_send_payment_message(row_id: str, record: dict, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def create_and_send_payment_message(row_id: str, record: ApprovalRecord, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Создание кнопок "Оплачено",
     создание и отправка сообщения для одобрения заявки.
@@ -341,11 +356,11 @@ async def create_and_send_payment_message(row_id: str, record: dict, context: Co
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     message_text = (
-        f"Запрос на платёж для заявки {row_id} одобрен {record["approved_by"]} "
-        f'{record["approvals_needed"]}/{record["approvals_received"]} раз. Пожалуйста, оплатите заявку. '
-        f'сумма: {record["amount"]}, статья: "{record["expense_item"]}", группа: "{record["expense_group"]}", '
-        f'партнер: "{record["partner"]}", период начисления: {record["period"]}, форма оплаты: '
-        f'{record["payment_method"]}, комментарий: {record["comment"]}'
+        f"Запрос на платёж для заявки {row_id} одобрен {record.approved_by} "
+        f'{record.approvals_needed}/{record.approvals_received} раз. Пожалуйста, оплатите заявку. '
+        f'сумма: {record.amount}, статья: "{record.expense_item}", группа: "{record.expense_group}", '
+        f'партнер: "{record.partner}", период начисления: {record.period}, форма оплаты: '
+        f'{record.payment_method}, комментарий: {record.comment}'
     )
     chat_ids_list = await chat_ids_department("payers")
     await send_message_and_save_data(context, chat_ids_list, message_text, row_id, "payment", reply_markup)
@@ -369,25 +384,14 @@ async def payment_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def make_payment_and_add_record_to_google_sheet(update: Update, context: ContextTypes.DEFAULT_TYPE,
                                                       row_id) -> None:
     async with db:
-        record = await db.get_row_by_id(row_id)
-        if not record:
-            raise NotFound(f"Счёт №{row_id} не найден")
-        await db.update_row_by_id(row_id, {"status": "Paid"})
-
-    if context.bot_data.get(f"{row_id}_payment"):
-        for chat_id, message_id in context.bot_data[f'{row_id}_payment']:
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    text=f"Счёт №{row_id} оплачен.",
-                    reply_markup=InlineKeyboardMarkup([])
-                )
-            except Exception as e:
-                logger.error(f"Не удалось обновить сообщение об оплате счёта с chat_id: {chat_id}: {e}")
-    del context.bot_data[f"{row_id}_payment"]
-    # При нажатии "Оплачено" добавляем данные в таблицу
-    await add_record_to_google_sheet(record)
+        record = await db.transition(row_id, ("Approved",), "Paid", enqueue_sheets_write=True)
+        message_refs = await db.pop_message_refs(row_id, "payment") if record else []
+    if record is None:
+        raise RuntimeError(f"Счёт №{row_id} не найден или уже оплачен.")
+    # Запись в таблицу выполняет фоновый воркер очереди 'sheets_outbox'
+    sheets_outbox.notify()
+
+    await close_stage(context, row_id, "payment", message_refs, f"Счёт №{row_id} оплачен.")
 
 
 async def check_department(approver_id: int) -> str | None:
@@ -435,15 +439,13 @@ async def reject_record_command(update: Update, context: ContextTypes.DEFAULT_TY
     approver = f"@{update.effective_user.username}"
     async with db:
         record = await db.get_row_by_id(row_id)
-        status = record.get("status")
-        initiator_id = record.get("initiator_id")
-        if not record:
-            raise RuntimeError(f"Счёт с id: {row_id} не найден.")
+    if not record:
+        raise RuntimeError(f"Счёт с id: {row_id} не найден.")
 
-    if status in ("Approved", "Rejected", "Paid"):
+    if record.status in ("Approved", "Rejected", "Paid"):
         raise RuntimeError("Счёт уже обработан")
 
-    await reject_record(context, update, row_id, approver, initiator_id, department)
+    await reject_record(context, update, row_id, approver, record.initiator_id, department)
 
 
 async def approve_record_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -461,10 +463,10 @@ async def approve_record_command(update: Update, context: ContextTypes.DEFAULT_T
     row_id = row_id[0]
     async with db:
         record = await db.get_row_by_id(row_id)
-        if not record:
-            raise RuntimeError(f"Счёт с id: {row_id} не найдена.")
+    if not record:
+        raise RuntimeError(f"Счёт с id: {row_id} не найдена.")
 
-    status = record.get("status")
+    status = record.status
     if status in ("Paid", "Rejected", "Approved"):
         raise RuntimeError("Счёт уже обработан")
 
@@ -482,57 +484,116 @@ async def approve_record_command(update: Update, context: ContextTypes.DEFAULT_T
 
     action = "approve"
     approver = f"@{update.message.from_user.username}"
-    amount = record.get("amount")
 
-    await approval_process(context, update, action, row_id, approver, department, amount)
+    await approval_process(context, update, action, row_id, approver, department, record.amount)
+
+
+async def refresh_categories_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Сбрасывает кэш данных листа "категории" и сразу загружает их заново. Доступно главам департамента.
+    """
+
+    if update.effective_chat.id not in Config.head_chat_ids:
+        raise PermissionError("Команда доступна только главе департамента!")
+
+    _, items = await category_cache.refresh(force=True)
+    await update.message.reply_text(f"Категории обновлены. Статей расхода: {len(items)}")
 
 
 async def show_not_paid_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    Возвращает инициатору в тг-чат неоплаченные заявки на платежи из таблицы "approvals" в удобном формате
+    Возвращает инициатору в тг-чат первую страницу неоплаченных заявок на платежи из таблицы "approvals"
+    в удобном формате с кнопками "назад"/"далее". Необязательные фильтры в аргументах команды:
+    status=<Not_processed|Pending|Approved>, dep=<head|finance|payers> (заявки, ожидающие этот департамент),
+    initiator=<id инициатора>.
     """
 
-    async with db:
-        rows = await db.find_not_paid()
-    messages = []
-
-    for i, record in enumerate(rows, start=1):
-        line = ", ".join([f"{key}: {value}" for key, value in record.items()])
-        message_line = f"{i}. {line}"
-        wrapped_message = textwrap.fill(message_line, width=4096)
-        messages.append(wrapped_message)
-
-    final_text = "\n\n".join(messages)
-    if not final_text:
-        await update.message.reply_text("Заявок не обнаружено")
-
-    if len(final_text) >= 4096:  # Максимальная длина сообщения в Telegram
-        parts = split_long_message(final_text)
-        for part in parts:
-            await update.message.reply_text(part)
-    if final_text:
-        await update.message.reply_text(final_text)
-
-    return
-
-
-def split_long_message(text: str) -> list[str]:
-    """Функция для разделения текста свыше 4096 символов"""
-    max_length = 4096
-    parts = []
-    current_part = ""
-
-    for line in text.split('\n'):
-        if len(current_part) + len(line) + 1 <= max_length:
-            current_part += (current_part and "\n") + line
+    status, initiator_id = parse_not_paid_filters(context.args or [])
+    text, reply_markup = await render_not_paid_page(status, initiator_id)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+
+async def not_paid_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик кнопок "назад"/"далее" списка неоплаченных заявок."""
+
+    query = update.callback_query
+    await query.answer()
+    try:
+        _, status_code, initiator, cursor = query.data.split("_")
+        status = {code: status for status, code in NOT_PAID_STATUS_CODES.items()}.get(status_code)
+        initiator_id = int(initiator) if initiator else None
+        after_id = int(cursor[1:]) if cursor[0] == "a" else None
+        before_id = int(cursor[1:]) if cursor[0] == "b" else None
+    except Exception as e:
+        raise RuntimeError(f"Ошибка считывания данных с кнопок списка неоплаченных заявок. Ошибка: {e}")
+
+    text, reply_markup = await render_not_paid_page(status, initiator_id, after_id, before_id)
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e):
+            raise
+
+
+def parse_not_paid_filters(args: list[str]) -> tuple[str | None, int | None]:
+    """Статус и инициатор из аргументов команды /show_not_paid вида key=value."""
+
+    status, initiator_id = None, None
+    statuses = {status.casefold(): status for status in NOT_PAID_STATUS_CODES}
+    for arg in args:
+        key, _, value = arg.partition("=")
+        if key == "status" and value.replace("_", " ").casefold() in statuses:
+            status = statuses[value.replace("_", " ").casefold()]
+        elif key == "dep" and value in DEPARTMENT_STATUSES:
+            status = DEPARTMENT_STATUSES[value]
+        elif key == "initiator" and value.isdigit():
+            initiator_id = int(value)
         else:
-            parts.append(current_part)
-            current_part = line
+            raise RuntimeError(
+                f"Неизвестный фильтр {arg}. Доступны: status=Not_processed|Pending|Approved, "
+                f"dep=head|finance|payers, initiator=<id>."
+            )
+    return status, initiator_id
 
-    if current_part:
-        parts.append(current_part)
 
-    return parts
+async def render_not_paid_page(status: str | None, initiator_id: int | None, after_id: int | None = None,
+                               before_id: int | None = None) -> tuple[str, InlineKeyboardMarkup | None]:
+    """
+    Текст и кнопки страницы неоплаченных заявок после after_id или перед before_id.
+    Готовые страницы хранятся в кэше, пока в базе не изменится ни одна заявка (db.write_generation).
+    """
+
+    key = (status, initiator_id, after_id, before_id, db.write_generation)
+    page = not_paid_pages.get(key)
+    if page is not None:
+        return page
+
+    # ошибка базы доходит до error_callback и не попадает в кэш страниц
+    records, has_more = await db.find_not_paid_page(after_id, before_id, status, initiator_id, SHOW_NOT_PAID_PAGE_SIZE)
+    if not records and (after_id or before_id):
+        # заявки с той стороны уже оплачены или отклонены: показываем первую страницу
+        return await render_not_paid_page(status, initiator_id)
+
+    if not records:
+        page = "Заявок не обнаружено", None
+    else:
+        lines = []
+        for record in records:
+            line = ", ".join([f"{key}: {value}" for key, value in record.to_display().items()])
+            if len(line) > NOT_PAID_RECORD_LENGTH:
+                line = line[:NOT_PAID_RECORD_LENGTH - 1] + "…"
+            lines.append(line)
+
+        callback_prefix = f"notpaid_{NOT_PAID_STATUS_CODES.get(status, '')}_{initiator_id or ''}"
+        buttons = []
+        if has_more if before_id is not None else bool(after_id):
+            buttons.append(InlineKeyboardButton("◀️ назад", callback_data=f"{callback_prefix}_b{records[0].id}"))
+        if has_more if before_id is None else True:
+            buttons.append(InlineKeyboardButton("далее ▶️", callback_data=f"{callback_prefix}_a{records[-1].id}"))
+        page = "\n\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+    not_paid_pages.put(key, page)
+    return page
 
 
 import traceback
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from config.config import Config
+from config.logging_config import logger
+from db import db
+from db.backup import backup_database, last_backup_time
+from marketing_budget_tennisi_bot.outbox import sheets_outbox
+from marketing_budget_tennisi_bot.sheets import category_cache, sheets_scheduler
+
+background_tasks: list[asyncio.Task] = []
+
+
+async def run_periodically(name: str, interval: float, job: Callable[[], Awaitable],
+                           first_delay: float = 0) -> None:
+    """
+    Выполняет job каждые interval секунд, первый раз — через first_delay секунд.
+    Ошибки логируются и не останавливают задачу.
+    """
+
+    await asyncio.sleep(first_delay)
+    while True:
+        try:
+            await job()
+        except Exception as e:
+            logger.error(f'Ошибка фоновой задачи "{name}": {e}')
+        await asyncio.sleep(interval)
+
+
+async def archive_processed_records() -> None:
+    """Перенос старых оплаченных и отклонённых счетов в архив."""
+
+    await db.archive_processed(Config.archive_after_days, Config.archive_batch_size)
+
+
+async def backup_database_file() -> None:
+    """Резервное копирование файла базы данных."""
+
+    await backup_database(
+        db.db_file,
+        Config.backup_dir,
+        Config.backup_keep,
+        pages=Config.backup_pages_per_step,
+        sleep=Config.backup_step_sleep,
+    )
+
+
+async def log_stats() -> None:
+    """Запись в лог счётчиков кэша счетов и длины очередей запросов к Google Sheets."""
+
+    logger.info(f"Кэш счетов: {db.cache_info()}, очередь запросов к Google Sheets: {sheets_scheduler.queue_depth}")
+
+
+def seconds_until_backup(interval: float) -> float:
+    """
+    Сколько ждать следующей резервной копии. Отсчёт ведётся от самой новой копии в каталоге,
+    поэтому перезапуск бота не создаёт внеочередную копию и не вытесняет ротацией старые.
+    """
+
+    last = last_backup_time(Config.backup_dir)
+    if last is None:
+        return 0
+    return max(0.0, last + interval - time.time())
+
+
+def start_background_jobs() -> None:
+    """Запуск фоновых задач бота. Вызывается из post_init."""
+
+    # заранее загружаем категории, чтобы первый /enter_record не ждал Google Sheets
+    category_cache.refresh_in_background()
+    jobs = [
+        ("archive", Config.archive_interval_hours * 3600, archive_processed_records, 0),
+    ]
+    if Config.backup_dir and db.db_file != ":memory:":
+        interval = Config.backup_interval_hours * 3600
+        jobs.append(("backup", interval, backup_database_file, seconds_until_backup(interval)))
+    if Config.stats_log_interval_minutes > 0:
+        interval = Config.stats_log_interval_minutes * 60
+        jobs.append(("stats", interval, log_stats, interval))
+    for name, interval, job, first_delay in jobs:
+        background_tasks.append(
+            asyncio.create_task(run_periodically(name, interval, job, first_delay), name=name)
+        )
+    # дописывает в Google Sheets счета, оплаченные до перезапуска, и дальше ждёт новых
+    background_tasks.append(asyncio.create_task(sheets_outbox.run(), name="sheets_outbox"))
+
+
+async def stop_background_jobs() -> None:
+    """Остановка фоновых задач бота. Вызывается из post_shutdown."""
+
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
@@ -0,0 +1,81 @@
+import asyncio
+import re
+import weakref
+from contextlib import AsyncExitStack
+from typing import Awaitable, Hashable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# номер счёта в callback_data кнопок "Одобрить"/"Отклонить"/"Оплачено" и в командах /approve_record, /reject_record
+INVOICE_CALLBACK = re.compile(r"^(?:approval_[a-z]+_[a-z]+|payment)_(\d+)$")
+INVOICE_COMMAND = re.compile(r"^/(?:approve|reject)_record(?:@\w+)?\s+(\d+)")
+
+
+class KeyedLocks:
+    """
+    Реестр asyncio.Lock по ключу. Блокировка существует, пока её кто-то держит или ждёт,
+    после чего удаляется из WeakValueDictionary сборщиком мусора, поэтому реестр не растёт.
+    """
+
+    def __init__(self):
+        self._locks: weakref.WeakValueDictionary[Hashable, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def __call__(self, key: Hashable) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+def update_lock_keys(update: object) -> list[tuple[str, int]]:
+    """
+    Ключи блокировок обновления: ("user", id) для диалога пользователя и ("invoice", номер)
+    для кнопок и команд, меняющих счёт. Отсортированы, чтобы блокировки брались в одном порядке.
+    """
+
+    if not isinstance(update, Update):
+        return []
+    keys = set()
+    if update.effective_user:
+        keys.add(("user", update.effective_user.id))
+
+    match = None
+    if update.callback_query and update.callback_query.data:
+        match = INVOICE_CALLBACK.match(update.callback_query.data)
+    elif update.effective_message and update.effective_message.text:
+        match = INVOICE_COMMAND.match(update.effective_message.text)
+    if match:
+        keys.add(("invoice", int(match.group(1))))
+    return sorted(keys)
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка до max_concurrent_updates обновлений. Обновления одного пользователя
+    и обновления, касающиеся одного счёта, выполняются по очереди; остальные — одновременно.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.locks = KeyedLocks()
+
+    async def process_update(self, update: object, coroutine: Awaitable) -> None:
+        # блокировки по ключам берутся до общего семафора: обновление, ждущее свою очередь,
+        # не занимает место и не задерживает обновления других пользователей
+        async with AsyncExitStack() as stack:
+            for key in update_lock_keys(update):
+                await stack.enter_async_context(self.locks(key))
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -1,3 +1,5 @@
+import asyncio
+
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -8,6 +10,7 @@ from telegram.ext import (
 )
 
 from config.config import Config
+from db import db
 
 from marketing_budget_tennisi_bot.conversation_handler import (
     enter_record,
@@ -18,6 +21,8 @@ from marketing_budget_tennisi_bot.conversation_handler import (
     input_comment,
     input_dates,
     input_payment_type,
+    turn_page,
+    filter_options,
     confirm_command,
     stop_dialog,
 )
@@ -28,10 +33,15 @@ from marketing_budget_tennisi_bot.handlers import (
     approval_handler,
     payment_handler,
     show_not_paid_command,
+    not_paid_page_handler,
     approve_record_command,
     reject_record_command,
+    refresh_categories_command,
     error_callback
 )
+from marketing_budget_tennisi_bot.jobs import start_background_jobs, stop_background_jobs
+from marketing_budget_tennisi_bot.locks import KeyedUpdateProcessor
+from marketing_budget_tennisi_bot.webhook import run_webhook
 
 (
     INPUT_SUM,
@@ -45,24 +55,57 @@ from marketing_budget_tennisi_bot.handlers import (
 ) = range(8)
 
 
+async def post_init(application: Application) -> None:
+    """Подготовка базы данных и запуск фоновых задач перед началом обработки обновлений."""
+    await db.initialize()
+    start_background_jobs()
+
+
+async def post_shutdown(application: Application) -> None:
+    """Остановка фоновых задач и закрытие соединений с базой данных при остановке бота."""
+    await stop_background_jobs()
+    await db.close()
+
+
 def main() -> None:
     """Основная функция для запуска бота."""
-    application = Application.builder().token(Config.telegram_bot_token).build()
+    application = (
+        Application.builder()
+        .token(Config.telegram_bot_token)
+        .concurrent_updates(KeyedUpdateProcessor(Config.max_concurrent_updates))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     application.add_handler(MessageHandler(~filters.User(user_id=Config.white_list), check_access))
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("submit_record", submit_record_command))
     application.add_handler(CommandHandler("reject_record", reject_record_command))
     application.add_handler(CommandHandler("approve_record", approve_record_command))
     application.add_handler(CommandHandler("show_not_paid", show_not_paid_command))
+    application.add_handler(CommandHandler("refresh_categories", refresh_categories_command))
     application.add_handler(CallbackQueryHandler(approval_handler, pattern="^approval_.*"))
     application.add_handler(CallbackQueryHandler(payment_handler, pattern="^payment_.*"))
+    application.add_handler(CallbackQueryHandler(not_paid_page_handler, pattern="^notpaid_"))
     conversation_handler = ConversationHandler(
         entry_points=[CommandHandler("enter_record", enter_record)],
         states={
             INPUT_SUM: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_sum)],
-            INPUT_ITEM: [CallbackQueryHandler(input_item)],
-            INPUT_GROUP: [CallbackQueryHandler(input_group)],
-            INPUT_PARTNER: [CallbackQueryHandler(input_partner)],
+            INPUT_ITEM: [
+                CallbackQueryHandler(turn_page, pattern="^page_"),
+                CallbackQueryHandler(input_item),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, filter_options),
+            ],
+            INPUT_GROUP: [
+                CallbackQueryHandler(turn_page, pattern="^page_"),
+                CallbackQueryHandler(input_group),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, filter_options),
+            ],
+            INPUT_PARTNER: [
+                CallbackQueryHandler(turn_page, pattern="^page_"),
+                CallbackQueryHandler(input_partner),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, filter_options),
+            ],
             INPUT_COMMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_comment)],
             INPUT_DATES: [MessageHandler(filters.TEXT & ~filters.COMMAND, input_dates)],
             INPUT_PAYMENT_TYPE: [CallbackQueryHandler(input_payment_type)],
@@ -74,7 +117,10 @@ def main() -> None:
     )
     application.add_handler(conversation_handler)
     application.add_error_handler(error_callback)
-    application.run_polling(close_loop=False)
+    if Config.telegram_webhook_url:
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(close_loop=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+from config.config import Config
+from config.logging_config import logger
+from db import db
+from db.db import SheetsWrite
+from marketing_budget_tennisi_bot.sheets import (
+    add_rows_to_google_sheet, build_payment_rows, format_rows_in_google_sheet, get_moscow_date,
+)
+
+# сколько раз повторяется форматирование уже добавленных строк, прежде чем от него отказаться
+FORMAT_ATTEMPTS = 5
+
+
+class SheetsOutboxWorker:
+    """
+    Фоновая запись оплаченных счетов в Google Sheets из очереди 'sheets_outbox'.
+    Счета, оплаченные в течение batch_window секунд, записываются вместе: строки всех счетов
+    добавляются одним append_rows и форматируются одним batch_format, не более batch_size строк за раз.
+    Задание удаляется из очереди только после успешной записи; при ошибке оно откладывается
+    с экспоненциально растущей паузой, поэтому недоступность Google Sheets и перезапуск бота
+    не теряют оплаченные счета. После успешного append_rows строки повторно не добавляются:
+    если не удалось удалить задания из очереди, их id запоминаются и удаляются при следующем
+    разборе, а неудачное форматирование повторяется отдельно, не более FORMAT_ATTEMPTS раз.
+    """
+
+    def __init__(self, batch_window: float, batch_size: int, base_delay: float, max_delay: float,
+                 poll_interval: float):
+        self.batch_window = batch_window
+        self.batch_size = max(1, batch_size)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._pending = 0
+        self._delivered: set[int] = set()
+        self._unformatted: dict[tuple[int, int], int] = {}
+
+    def notify(self) -> None:
+        """Будит воркер после постановки нового задания в очередь."""
+
+        self._pending += 1
+        self._wakeup.set()
+        if self._pending >= self.batch_size:
+            self._batch_full.set()
+
+    def backoff(self, attempts: int) -> float:
+        """Пауза перед следующей попыткой после attempts неудачных."""
+
+        return min(self.base_delay * 2 ** attempts, self.max_delay)
+
+    async def run(self) -> None:
+        """Разбирает очередь, пока задача не будет отменена."""
+
+        while True:
+            timeout = self.poll_interval
+            try:
+                if await self.flush():
+                    continue
+                next_attempt_at = await db.next_sheets_write_at()
+                if next_attempt_at is not None:
+                    timeout = min(timeout, max(0.0, next_attempt_at - time.time()))
+            except Exception as e:
+                logger.error(f"Ошибка очереди записи в Google Sheets: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+                # копим оплаченные счета в течение окна или пока не наберётся полная пачка
+                await asyncio.wait_for(self._batch_full.wait(), self.batch_window)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._batch_full.clear()
+            self._pending = 0
+
+    async def flush(self) -> dict[int, str | None]:
+        """
+        Записывает одной пачкой счета, срок записи которых наступил, в порядке постановки в очередь.
+        Счёт, строки которого не удалось получить, исключается из пачки и откладывается отдельно.
+        В колонку даты пишется дата оплаты счёта: время создания задания в очереди.
+        :return: словарь из номера счёта и текста ошибки (None, если счёт записан)
+        """
+
+        await self._complete_delivered()
+        await self._format_appended()
+
+        writes = await db.fetch_due_sheets_writes(self.batch_size)
+        statuses = {}
+        batch, rows = [], []
+        for write in sorted(writes, key=lambda w: w.id):
+            try:
+                record = await db.get_row_by_id(write.row_id)
+                if record is None:
+                    raise RuntimeError(f"Счёт №{write.row_id} не найден.")
+                # дата оплаты — время постановки в очередь, а не время записи в таблицу
+                record_rows = build_payment_rows(record, get_moscow_date(write.created_at))
+            except Exception as e:
+                statuses[write.row_id] = await self._retry(write, e)
+                continue
+            if batch and len(rows) + len(record_rows) > self.batch_size:
+                break
+            batch.append(write)
+            rows.extend(record_rows)
+
+        if not batch:
+            return statuses
+        try:
+            appended = await add_rows_to_google_sheet(rows)
+        except Exception as e:
+            for write in batch:
+                statuses[write.row_id] = await self._retry(write, e)
+            return statuses
+
+        # строки уже в таблице: с этого момента задания считаются выполненными
+        self._delivered.update(write.id for write in batch)
+        for write in batch:
+            statuses[write.row_id] = None
+        logger.info(f"Счета №{', '.join(str(write.row_id) for write in batch)} добавлены в Google Sheets "
+                    f"({len(rows)} строк).")
+        if appended is not None:
+            self._unformatted[appended] = 0
+        await self._complete_delivered()
+        await self._format_appended()
+        return statuses
+
+    async def _complete_delivered(self) -> None:
+        """Удаляет из очереди задания, строки которых уже добавлены в таблицу."""
+
+        if self._delivered:
+            delivered = list(self._delivered)
+            await db.complete_sheets_writes(delivered)
+            self._delivered.difference_update(delivered)
+
+    async def _format_appended(self) -> None:
+        """Форматирует добавленные строки; ошибка не приводит к повторному добавлению строк."""
+
+        for (first_row, last_row), attempts in list(self._unformatted.items()):
+            try:
+                await format_rows_in_google_sheet(first_row, last_row)
+            except Exception as e:
+                if attempts + 1 < FORMAT_ATTEMPTS:
+                    self._unformatted[first_row, last_row] = attempts + 1
+                    logger.warning(f"Не удалось отформатировать строки {first_row}-{last_row} "
+                                   f"(попытка {attempts + 1}), повтор при следующей записи: {e}")
+                    continue
+                logger.error(f"Строки {first_row}-{last_row} оставлены без форматирования: {e}")
+            del self._unformatted[first_row, last_row]
+
+    async def _retry(self, write: SheetsWrite, error: Exception) -> str:
+        delay = self.backoff(write.attempts)
+        logger.error(f"Не удалось добавить счёт №{write.row_id} в Google Sheets "
+                     f"(попытка {write.attempts + 1}), повтор через {delay:.0f} с: {error}")
+        await db.reschedule_sheets_write(write.id, delay, str(error))
+        return str(error)
+
+
+sheets_outbox = SheetsOutboxWorker(
+    Config.sheets_outbox_batch_window,
+    Config.sheets_outbox_batch_size,
+    Config.sheets_outbox_base_delay,
+    Config.sheets_outbox_max_delay,
+    Config.sheets_outbox_poll_interval,
+)
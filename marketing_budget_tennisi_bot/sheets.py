@@ -1,14 +1,22 @@
+import asyncio
+import time
 from datetime import datetime
 from decimal import Decimal, ROUND_HALF_UP
 
 import gspread_asyncio
-import pandas as pd
 import pytz
 
 from google.oauth2.service_account import Credentials
+from gspread.utils import a1_to_rowcol
 
 from config.config import Config
 from config.logging_config import logger
+from db.db import ApprovalRecord
+from marketing_budget_tennisi_bot.categories import (
+    CategoryIndex, apply_category_diff, category_keys, tree_from_keys,
+)
+from marketing_budget_tennisi_bot.fake_sheets import FakeSheetsBackend, load_categories
+from marketing_budget_tennisi_bot.sheets_quota import BACKGROUND, INTERACTIVE, QuotaExceeded, SheetsScheduler
 
 text_format = {
     "textFormat": {"fontFamily": "Lato"}
@@ -23,20 +31,84 @@ currency_format = {  # паттерн для преобразования чис
 }
 
 
-async def get_today_moscow_time() -> str:
-    """Функция для получения текущей даты"""
+def get_moscow_date(utc_timestamp: str | None) -> str:
+    """
+    Дата по Москве для времени UTC вида 'YYYY-MM-DD HH:MM:SS' (CURRENT_TIMESTAMP SQLite).
+    Без времени возвращает текущую дату.
+    """
 
-    moscow_tz = pytz.timezone("Europe/Moscow")
-    today = datetime.now(moscow_tz)
-    formatted_date = today.strftime("%d.%m.%Y")
-    return formatted_date
+    moment = datetime.now(pytz.utc)
+    if utc_timestamp:
+        moment = pytz.utc.localize(datetime.strptime(utc_timestamp, "%Y-%m-%d %H:%M:%S"))
+    return moment.astimezone(pytz.timezone("Europe/Moscow")).strftime("%d.%m.%Y")
 
 
-async def add_record_to_google_sheet(record: dict) -> None:
-    """Функция для добавления строки в таблицу Google Sheet."""
-    manager = GoogleSheetsManager()
+def build_payment_rows(payment_info: ApprovalRecord, today_date: str) -> list[list]:
+    """Строки листа счетов для оплаченного счёта: по одной на каждый месяц начисления"""
+
+    period = payment_info.period.split(" ")
+    months = [
+        datetime.strptime(f"01.{a}", "%d.%m.%y").strftime("%d.%m.%Y")
+        for a in period
+    ]
+    total_sum = Decimal(payment_info.amount) / Decimal(len(months))
+    rounded_sum = float(total_sum.quantize(Decimal('0.0000000001'), rounding=ROUND_HALF_UP))
+    return [
+        [
+            today_date,
+            rounded_sum,
+            payment_info.expense_item,
+            payment_info.expense_group,
+            payment_info.partner,
+            payment_info.comment,
+            month,
+            payment_info.payment_method,
+        ]
+        for month in months
+    ]
+
+
+def get_appended_rows(response: dict) -> tuple[int, int] | None:
+    """Номера первой и последней строк, добавленных append_rows, из ответа Sheets API"""
+
+    updated_range = (response or {}).get("updates", {}).get("updatedRange")
+    if not updated_range:
+        return None
+    cells = updated_range.split("!")[-1].split(":")
+    first_row, _ = a1_to_rowcol(cells[0])
+    last_row, _ = a1_to_rowcol(cells[-1])
+    return first_row, last_row
+
+
+def payment_rows_formats(first_row: int, last_row: int) -> list[dict]:
+    """Форматы шрифта, дат и сумм только для строк first_row..last_row листа счетов"""
+
+    return [
+        {"range": f"A{first_row}:H{last_row}", "format": text_format},
+        {"range": f"A{first_row}:A{last_row}", "format": date_format},
+        {"range": f"B{first_row}:B{last_row}", "format": currency_format},
+        {"range": f"G{first_row}:G{last_row}", "format": date_format},
+    ]
+
+
+async def add_rows_to_google_sheet(rows: list[list]) -> tuple[int, int] | None:
+    """
+    Функция для добавления готовых строк нескольких счетов в таблицу Google Sheet одним запросом.
+    Строки не форматируются, см. format_rows_in_google_sheet.
+    :return: номера первой и последней добавленных строк или None, если их не удалось определить
+    """
+    manager = GoogleSheetsManager(priority=BACKGROUND)
     await manager.initialize_google_sheets()
-    await manager.add_payment_to_sheet(record)
+    worksheet = await manager.get_records_worksheet()
+    return await manager.append_payment_rows(worksheet, rows)
+
+
+async def format_rows_in_google_sheet(first_row: int, last_row: int) -> None:
+    """Функция для форматирования строк first_row..last_row листа счетов одним запросом."""
+    manager = GoogleSheetsManager(priority=BACKGROUND)
+    await manager.initialize_google_sheets()
+    worksheet = await manager.get_records_worksheet()
+    await manager.format_payment_rows(worksheet, first_row, last_row)
 
 
 def get_credentials() -> Credentials:
@@ -53,92 +125,260 @@ def get_credentials() -> Credentials:
     return scoped
 
 
+class QuotaAwareClientManager(gspread_asyncio.AsyncioGspreadClientManager):
+    """
+    Менеджер клиента, темп запросов которого задаёт sheets_scheduler: собственная пауза
+    gspread_asyncio между запросами отключена, а ответ 429 не повторяется под общей блокировкой,
+    а возвращается планировщику, который ставит запрос обратно в очередь.
+    """
+
+    async def delay(self):
+        return
+
+    async def handle_gspread_error(self, e, method, args, kwargs):
+        if e.response.status_code == 429:
+            raise QuotaExceeded(str(e)) from e
+        await super().handle_gspread_error(e, method, args, kwargs)
+
+    async def get_last_update_time(self, worksheet: gspread_asyncio.AsyncioGspreadWorksheet) -> str:
+        """Время последнего изменения таблицы листа worksheet (modifiedTime из Drive API)"""
+
+        return await self._call(worksheet.ws.spreadsheet.get_lastUpdateTime)
+
+
+def create_client_manager() -> QuotaAwareClientManager | FakeSheetsBackend:
+    """Менеджер клиента выбранного в SHEETS_BACKEND бэкенда: google или fake"""
+
+    if Config.sheets_backend == "google":
+        return QuotaAwareClientManager(get_credentials)
+    if Config.sheets_backend == "fake":
+        backend = FakeSheetsBackend(
+            latency=Config.sheets_fake_latency,
+            reads_per_minute=Config.sheets_fake_reads_per_minute,
+            writes_per_minute=Config.sheets_fake_writes_per_minute,
+            failure_rate=Config.sheets_fake_failure_rate,
+        )
+        if Config.sheets_fake_categories_file:
+            categories = backend.spreadsheet(Config.google_sheets_spreadsheet_id).worksheet(
+                Config.google_sheets_categories_sheet_id
+            )
+            load_categories(categories, Config.sheets_fake_categories_file)
+        logger.warning("Google Sheets заменён локальным FakeSheetsBackend.")
+        return backend
+    raise RuntimeError(f"Неизвестный SHEETS_BACKEND: {Config.sheets_backend}")
+
+
+# Один менеджер клиента на процесс: он хранит авторизованный клиент и его HTTP-сессию
+# и запрашивает новые учётные данные только по истечении reauth_interval
+client_manager = create_client_manager()
+
+# Общие для процесса квоты запросов к Google Sheets
+sheets_scheduler = SheetsScheduler(Config.sheets_reads_per_minute, Config.sheets_writes_per_minute)
+
+# Открытые листы по (id таблицы, id листа). Сбрасываются, когда client_manager выдаёт новый клиент
+_worksheets: dict[tuple[str, int], gspread_asyncio.AsyncioGspreadWorksheet] = {}
+_worksheets_client: gspread_asyncio.AsyncioGspreadClient | None = None
+
+
 class GoogleSheetsManager:
     """Класс для обработки Google Sheets таблиц."""
 
-    def __init__(self):
+    def __init__(self, priority: int = INTERACTIVE):
+        self.priority = priority
         self.sheets_spreadsheet_id = Config.google_sheets_spreadsheet_id
         self.records_sheet_id = Config.google_sheets_records_sheet_id
         self.categories_sheet_id = Config.google_sheets_categories_sheet_id
-        self.options_dict = None
-        self.items = None
         self.agc = None
 
     async def initialize_google_sheets(self) -> gspread_asyncio.AsyncioGspreadClient:
         """Инициализация в Google Sheets"""
 
         try:
-            agcm = gspread_asyncio.AsyncioGspreadClientManager(get_credentials)
-            self.agc = await agcm.authorize()
+            self.agc = await client_manager.authorize()
             return self.agc
         except Exception as e:
             raise RuntimeError(f"Не удалось авторизоваться в сервисе Google Sheet. Ошибка: {e}")
 
-    async def add_payment_to_sheet(self, payment_info: dict[str, str]) -> None:
-        """Добавление счёта в таблицу"""
+    async def get_worksheet(self, sheet_id: int | str) -> gspread_asyncio.AsyncioGspreadWorksheet:
+        """Открытие листа таблицы по id. Открытые листы запоминаются для всего процесса."""
 
-        try:
-            spreadsheet = await self.agc.open_by_key(self.sheets_spreadsheet_id)
-            worksheet = await spreadsheet.get_worksheet_by_id(0)
-            logger.info(f"Открытие листа: {self.sheets_spreadsheet_id}")
+        global _worksheets_client
+        if _worksheets_client is not self.agc:
+            _worksheets.clear()
+            _worksheets_client = self.agc
+
+        key = (self.sheets_spreadsheet_id, int(sheet_id))
+        if key not in _worksheets:
+            spreadsheet = await self._read(self.agc.open_by_key, self.sheets_spreadsheet_id)
+            _worksheets[key] = await self._read(spreadsheet.get_worksheet_by_id, int(sheet_id))
+            logger.info(f"Открытие листа: {self.sheets_spreadsheet_id}, id листа: {sheet_id}")
+        return _worksheets[key]
+
+    async def _read(self, func, *args, **kwargs):
+        """Запрос на чтение в пределах квоты sheets_scheduler с приоритетом менеджера"""
+
+        return await sheets_scheduler.call("read", self.priority, func, *args, **kwargs)
+
+    async def _write(self, func, *args, **kwargs):
+        """Запрос на запись в пределах квоты sheets_scheduler с приоритетом менеджера"""
 
+        return await sheets_scheduler.call("write", self.priority, func, *args, **kwargs)
+
+    async def get_records_worksheet(self) -> gspread_asyncio.AsyncioGspreadWorksheet:
+        """Открытие листа счетов"""
+
+        try:
+            return await self.get_worksheet(0)
         except Exception as e:
             raise RuntimeError(f"Ошибка при открытии или доступе к листу: {e}")
 
-        today_date = await get_today_moscow_time()
-        period = payment_info["period"].split(" ")
-        months = [
-            datetime.strptime(f"01.{a}", "%d.%m.%y").strftime("%d.%m.%Y")
-            for a in period
-        ]
-        total_sum = Decimal(payment_info["amount"]) / Decimal(len(months))
-        rounded_sum = float(total_sum.quantize(Decimal('0.0000000001'), rounding=ROUND_HALF_UP))
-        for month in months:
-            row_data = [
-                today_date,
-                rounded_sum,
-                payment_info["expense_item"],
-                payment_info["expense_group"],
-                payment_info["partner"],
-                payment_info["comment"],
-                month,
-                payment_info["payment_method"],
-            ]
-            await worksheet.append_row(row_data, value_input_option="USER_ENTERED")
-            logger.info(f"Добавлена строка: {row_data}")
-        await worksheet.format("A:H", text_format)
-        await worksheet.format("A3:A", date_format)
-        await worksheet.format("B3:B", currency_format)
-        await worksheet.format("G3:G", date_format)
-
-    async def get_data(self) -> tuple[dict[str, dict[str, list[str]]], list[str]]:
+    async def append_payment_rows(self, worksheet: gspread_asyncio.AsyncioGspreadWorksheet,
+                                  rows: list[list]) -> tuple[int, int] | None:
         """
-        Получение списка статей и списка словарей данных из таблицы "категории"
+        Добавление строк в лист счетов одним запросом append_rows.
+        :return: номера первой и последней добавленных строк или None, если их не удалось определить
         """
 
+        response = await self._write(worksheet.append_rows, rows, value_input_option="USER_ENTERED")
+        logger.info(f"Добавлены строки: {rows}")
+        appended = get_appended_rows(response)
+        if appended is None:
+            logger.warning(f"Не удалось определить добавленные строки для форматирования: {response}")
+        return appended
+
+    async def format_payment_rows(self, worksheet: gspread_asyncio.AsyncioGspreadWorksheet,
+                                  first_row: int, last_row: int) -> None:
+        """Форматирование только строк first_row..last_row листа счетов одним запросом batch_format"""
+
+        await self._write(worksheet.batch_format, payment_rows_formats(first_row, last_row))
+
+    async def get_category_records(self) -> list[dict]:
+        """Получение строк листа "категории" """
+
         try:
-            spreadsheet = await self.agc.open_by_key(self.sheets_spreadsheet_id)
-            worksheet = await spreadsheet.get_worksheet_by_id(self.categories_sheet_id)
+            worksheet = await self.get_worksheet(self.categories_sheet_id)
         except Exception as e:
             raise RuntimeError(f'Ошибка получения данных с листа "категории". Ошибка: {e}')
 
-        df = pd.DataFrame(await worksheet.get_all_records())
-        unique_items = df["Статья"].unique()
-        data_structure = {}
-
-        for _, row in df.iterrows():
-            category = row["Статья"]
-            group = row["Группа"]
-            partner = row["Партнер"]
+        return await self._read(worksheet.get_all_records)
 
-            if category not in data_structure:
-                data_structure[category] = {}
-
-            if group not in data_structure[category]:
-                data_structure[category][group] = []
+    async def get_revision(self) -> str | None:
+        """
+        Отпечаток содержимого листа "категории": значение формулы в ячейке CATEGORIES_FINGERPRINT_CELL
+        этого листа (один запрос на чтение). Если ячейка не задана или не прочиталась — время последнего
+        изменения всей таблицы из Drive API (modifiedTime), которое меняется и при записи счетов.
+        None, если не удалось получить ни то, ни другое.
+        """
 
-            data_structure[category][group].append(partner)
+        try:
+            worksheet = await self.get_worksheet(self.categories_sheet_id)
+        except Exception as e:
+            logger.warning(f'Не удалось открыть лист "категории" для проверки изменений: {e}')
+            return None
+
+        if Config.categories_fingerprint_cell:
+            try:
+                cell = await self._read(worksheet.acell, Config.categories_fingerprint_cell)
+                if cell.value:
+                    return f"cell:{cell.value}"
+                logger.warning(f"Ячейка отпечатка {Config.categories_fingerprint_cell} листа \"категории\" пуста.")
+            except Exception as e:
+                logger.warning(f'Не удалось прочитать отпечаток листа "категории": {e}')
 
-        self.options_dict, self.items = data_structure, unique_items
+        try:
+            return f"modified:{await client_manager.get_last_update_time(worksheet)}"
+        except Exception as e:
+            logger.warning(f"Не удалось получить время изменения таблицы: {e}")
+            return None
+
+
+class CategoryCache:
+    """
+    Общий для процесса кэш данных листа "категории" со временем жизни ttl секунд.
+    Устаревший снимок отдаётся сразу, а обновление запускается в фоне; если обновление не удалось,
+    продолжает использоваться прежний снимок. Ждать загрузки приходится только при первом обращении.
+    Обновление сначала сверяет отпечаток листа (см. get_revision) и скачивает лист, только если он изменился;
+    к снимку применяются лишь добавленные и удалённые строки.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshot: tuple[dict[str, dict[str, list[str]]], list[str]] | None = None
+        self._loaded_at: float | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self._revision: str | None = None
+        self._keys: set[tuple[str, str, str]] = set()
+        self._index: CategoryIndex | None = None
+        # обновления выполняются по одному: более старая загрузка не перезапишет более новую
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    async def refresh(self, force: bool = False) -> tuple[dict[str, dict[str, list[str]]], list[str]]:
+        """
+        Загружает изменения категорий из таблицы. При ошибке прежний снимок сохраняется.
+        force=True скачивает лист, даже если отпечаток не изменился.
+        """
 
-        return data_structure, unique_items
+        async with self._lock:
+            return await self._refresh(force)
+
+    async def _refresh(self, force: bool) -> tuple[dict[str, dict[str, list[str]]], list[str]]:
+        manager = GoogleSheetsManager()
+        await manager.initialize_google_sheets()
+        revision = await manager.get_revision()
+        if not force and self._snapshot is not None and revision is not None and revision == self._revision:
+            self._loaded_at = time.monotonic()
+            logger.info('Лист "категории" не менялся, данные актуальны.')
+            return self._snapshot
+
+        keys = category_keys(await manager.get_category_records())
+        new_keys = set(keys)
+        if self._snapshot is None:
+            snapshot = tree_from_keys(keys)
+            logger.info(f'Данные листа "категории" загружены: {len(keys)} строк.')
+        else:
+            removed = self._keys - new_keys
+            added = [key for key in keys if key not in self._keys]
+            snapshot = self._snapshot
+            if removed or added:
+                tree = apply_category_diff(self._snapshot[0], removed, added)
+                snapshot = tree, list(tree)
+            logger.info(f'Данные листа "категории" обновлены: +{len(added)}, -{len(removed)} строк.')
+        self._snapshot, self._keys, self._revision = snapshot, new_keys, revision
+        self._loaded_at = time.monotonic()
+        return snapshot
+
+    def refresh_in_background(self) -> asyncio.Task:
+        """Запускает обновление, если оно ещё не идёт, и возвращает его задачу."""
+
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+            self._refresh_task.add_done_callback(self._log_refresh_error)
+        return self._refresh_task
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logger.error(f'Не удалось обновить данные листа "категории": {task.exception()}')
+
+    async def get(self) -> tuple[dict[str, dict[str, list[str]]], list[str]]:
+        """Возвращает словарь статей, групп и партнёров и список статей."""
+
+        if self._snapshot is None:
+            return await asyncio.shield(self.refresh_in_background())
+        if self.is_stale:
+            self.refresh_in_background()
+        return self._snapshot
+
+    def index_for(self, tree: dict[str, dict[str, list[str]]]) -> CategoryIndex:
+        """Индексы поиска для снимка tree, общие для всех диалогов, начатых с этим снимком."""
+
+        if self._index is None or self._index.tree is not tree:
+            self._index = CategoryIndex(tree)
+        return self._index
+
+
+category_cache = CategoryCache(Config.categories_cache_ttl)
@@ -0,0 +1,113 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from config.logging_config import logger
+
+T = TypeVar("T")
+
+# Приоритеты запросов: чем меньше число, тем раньше запрос получит квоту
+INTERACTIVE = 0  # запросы, которых ждёт пользователь в диалоге
+BACKGROUND = 1  # фоновые записи из очереди 'sheets_outbox'
+
+BURST_SECONDS = 10  # запас квоты, который можно израсходовать сразу, в секундах равномерного потока
+QUOTA_RETRY_DELAY = 5
+MAX_QUOTA_RETRY_DELAY = 60
+
+
+class QuotaExceeded(Exception):
+    """Google Sheets ответил 429: квота запросов в минуту исчерпана."""
+
+
+class TokenBucket:
+    """
+    Ведро токенов на rate_per_minute запросов в минуту. Ожидающие запросы получают токены
+    в порядке приоритета, а при равном приоритете — в порядке очереди.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Condition()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def pause(self, delay: float) -> None:
+        """Не выдаёт токены delay секунд и обнуляет запас, например после ответа 429."""
+
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._paused_until = max(self._paused_until, self._updated + delay)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority: int) -> None:
+        """Ждёт токен. Запрос с меньшим priority обслуживается раньше."""
+
+        entry = (priority, next(self._seq))
+        async with self._changed:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    timeout = None
+                    if self._waiters[0] == entry:
+                        if now >= self._paused_until and self._tokens >= 1:
+                            self._tokens -= 1
+                            return
+                        timeout = max(self._paused_until - now, (1 - self._tokens) / self.rate, 0.0)
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._changed.notify_all()
+
+
+class SheetsScheduler:
+    """
+    Планировщик запросов к Google Sheets с раздельными квотами на чтение и запись.
+    При превышении квоты запрос не завершается ошибкой, а возвращается в очередь.
+    """
+
+    def __init__(self, reads_per_minute: float, writes_per_minute: float):
+        self.buckets = {
+            "read": TokenBucket(reads_per_minute),
+            "write": TokenBucket(writes_per_minute),
+        }
+
+    @property
+    def queue_depth(self) -> dict[str, int]:
+        """Число запросов, ожидающих квоту, по видам."""
+
+        return {kind: bucket.queue_depth for kind, bucket in self.buckets.items()}
+
+    async def call(self, kind: str, priority: int, func: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """Выполняет запрос func вида kind ('read' или 'write') в пределах квоты."""
+
+        bucket = self.buckets[kind]
+        attempts = 0
+        while True:
+            await bucket.acquire(priority)
+            try:
+                return await func(*args, **kwargs)
+            except QuotaExceeded:
+                delay = min(QUOTA_RETRY_DELAY * 2 ** attempts, MAX_QUOTA_RETRY_DELAY)
+                attempts += 1
+                bucket.pause(delay)
+                logger.warning(f"Квота Google Sheets на {kind} исчерпана, запрос {func.__name__} повторится "
+                               f"через {delay} с. Очередь: {self.queue_depth}")
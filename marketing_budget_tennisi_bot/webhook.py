@@ -0,0 +1,110 @@
+import asyncio
+import signal
+from urllib.parse import urlparse
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+from telegram import Update
+from telegram.ext import Application
+
+from config.config import Config
+from config.logging_config import logger
+from marketing_budget_tennisi_bot.sheets import sheets_scheduler
+
+HEALTH_PATH = "/healthz"
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    """
+    GET HEALTH_PATH: состояние бота, длина очереди обновлений и очередей запросов к Google Sheets;
+    503, пока бот не запущен.
+    """
+
+    SUPPORTED_METHODS = ("GET",)
+
+    def initialize(self, bot_application: Application) -> None:
+        self.bot_application = bot_application
+
+    def get(self) -> None:
+        running = self.bot_application.running
+        self.set_status(200 if running else 503)
+        self.write({
+            "ok": running,
+            "update_queue": self.bot_application.update_queue.qsize(),
+            "sheets_queue": sheets_scheduler.queue_depth,
+        })
+
+
+class HealthServer:
+    """
+    HTTP-сервер проверки состояния на tornado. Webhook-сервер python-telegram-bot (Updater.start_webhook)
+    обслуживает только путь webhook, поэтому проверка состояния слушает отдельный порт.
+    """
+
+    def __init__(self, application: Application, listen: str, port: int):
+        self.listen = listen
+        self.port = port
+        self._app = tornado.web.Application([(HEALTH_PATH, HealthHandler, {"bot_application": application})])
+        self._server: HTTPServer | None = None
+
+    async def start(self) -> None:
+        sockets = bind_sockets(self.port, self.listen)
+        # при port=0 система выбирает свободный порт
+        self.port = sockets[0].getsockname()[1]
+        self._server = HTTPServer(self._app)
+        self._server.add_sockets(sockets)
+        logger.info(f"Проверка состояния доступна на {self.listen}:{self.port}{HEALTH_PATH}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop()
+            await self._server.close_all_connections()
+            self._server = None
+
+
+async def run_webhook(application: Application) -> None:
+    """
+    Запуск бота в режиме webhook: webhook-сервер python-telegram-bot регистрирует
+    Config.telegram_webhook_url в Telegram с секретным токеном и принимает обновления
+    до SIGINT/SIGTERM. Жизненный цикл повторяет run_polling: post_shutdown и остановка
+    приложения выполняются и тогда, когда запуск завершился ошибкой.
+    """
+
+    if not Config.webhook_secret_token:
+        raise RuntimeError("Для режима webhook необходимо задать WEBHOOK_SECRET_TOKEN.")
+    health_server = HealthServer(application, Config.webhook_listen, Config.webhook_health_port)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.updater.start_webhook(
+            listen=Config.webhook_listen,
+            port=Config.webhook_port,
+            url_path=urlparse(Config.telegram_webhook_url).path,
+            webhook_url=Config.telegram_webhook_url,
+            secret_token=Config.webhook_secret_token,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        await application.start()
+        await health_server.start()
+        logger.info("Бот запущен в режиме webhook.")
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        await health_server.stop()
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
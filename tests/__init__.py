@@ -0,0 +1,20 @@
+import os
+
+# Config читает обязательные переменные окружения при импорте
+for name, value in {
+    "TELEGRAM_BOT_TOKEN": "123456:test",
+    "DATABASE_PATH": ":memory:",
+    "HEAD_CHAT_IDS": "0",
+    "FINANCE_CHAT_IDS": "0",
+    "PAYERS_CHAT_IDS": "0",
+    "INITIATORS_CHAT_IDS": "0",
+    "DEVELOPER_CHAT_ID": "0",
+    "WHITE_LIST": "0",
+    "SHEETS_BACKEND": "fake",
+    "SHEETS_FAKE_LATENCY": "0",
+    "GOOGLE_SHEETS_SPREADSHEET_ID": "test",
+    "GOOGLE_SHEETS_RECORDS_SHEET_ID": "0",
+    "GOOGLE_SHEETS_CATEGORIES_SHEET_ID": "1",
+}.items():
+    os.environ.setdefault(name, value)
+os.makedirs("logs", exist_ok=True)
@@ -0,0 +1,60 @@
+"""
+Тесты кэша категорий CategoryCache на FakeSheetsBackend. Запуск из корня репозитория:
+    python -m unittest discover -s tests -t .
+"""
+import asyncio
+import unittest
+from unittest import mock
+
+from config.config import Config
+from marketing_budget_tennisi_bot.categories import CATEGORY_COLUMNS
+from marketing_budget_tennisi_bot.fake_sheets import FakeWorksheet
+from marketing_budget_tennisi_bot.sheets import CategoryCache, client_manager
+
+OLD_ROWS = [["Маркетинг", "Реклама", "Яндекс"]]
+NEW_ROWS = [["Маркетинг", "Реклама", "Яндекс"], ["Офис", "Аренда", "Бизнес-центр"]]
+
+
+class CategoryCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.worksheet = client_manager.spreadsheet(Config.google_sheets_spreadsheet_id).worksheet(
+            Config.google_sheets_categories_sheet_id
+        )
+        self.worksheet.rows = [list(CATEGORY_COLUMNS), *OLD_ROWS]
+        self.addCleanup(setattr, self.worksheet, "rows", [])
+        self.cache = CategoryCache(ttl=600)
+
+    async def test_forced_refresh_is_not_overwritten_by_background_refresh(self):
+        get_all_records = FakeWorksheet.get_all_records
+        downloaded = asyncio.Event()
+
+        async def slow_first_download(worksheet: FakeWorksheet) -> list[dict]:
+            records = await get_all_records(worksheet)
+            if not downloaded.is_set():
+                # фоновое обновление скачало лист до правки и отвечает медленно
+                downloaded.set()
+                await asyncio.sleep(0.1)
+            return records
+
+        with mock.patch.object(FakeWorksheet, "get_all_records", slow_first_download):
+            background = self.cache.refresh_in_background()
+            await asyncio.wait_for(downloaded.wait(), 5)
+            self.worksheet.rows = [list(CATEGORY_COLUMNS), *NEW_ROWS]
+            _, items = await self.cache.refresh(force=True)
+            await background
+
+        self.assertEqual(items, ["Маркетинг", "Офис"])
+        self.assertEqual((await self.cache.get())[1], ["Маркетинг", "Офис"])
+
+    async def test_refresh_skips_download_when_revision_is_unchanged(self):
+        await self.cache.refresh()
+        with mock.patch.object(FakeWorksheet, "get_all_records") as get_all_records:
+            await self.cache.refresh()
+            get_all_records.assert_not_called()
+            await self.cache.refresh(force=True)
+            get_all_records.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
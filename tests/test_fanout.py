@@ -0,0 +1,77 @@
+"""
+Тесты рассылки fan_out/deliver. Запуск из корня репозитория:
+    python -m unittest discover -s tests -t .
+"""
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from telegram.error import RetryAfter, TimedOut
+
+from marketing_budget_tennisi_bot import fanout
+from marketing_budget_tennisi_bot.fanout import RateLimiter, fan_out
+
+RETRY_AFTER = 0.3
+
+
+class FanOutTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        patchers = [
+            mock.patch.object(fanout, "rate_limiter", RateLimiter(1000, 1000)),
+            mock.patch.object(fanout, "_semaphore", asyncio.Semaphore(1)),
+            mock.patch.object(fanout.Config, "telegram_send_attempts", 3),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sent_at: dict[int, list[float]] = {}
+
+    async def test_retry_after_does_not_hold_semaphore(self):
+        started = time.monotonic()
+
+        async def request(chat_id: int) -> int:
+            self.sent_at.setdefault(chat_id, []).append(time.monotonic() - started)
+            await asyncio.sleep(0.01)
+            if chat_id == 1 and len(self.sent_at[1]) == 1:
+                raise RetryAfter(RETRY_AFTER)
+            return chat_id
+
+        deliveries = await fan_out([1, 2, 3], request)
+
+        self.assertEqual([delivery.result for delivery in deliveries], [1, 2, 3])
+        # пока чат 1 ждёт RetryAfter, единственный слот семафора свободен для чатов 2 и 3
+        self.assertLess(max(self.sent_at[2][0], self.sent_at[3][0]), RETRY_AFTER / 2)
+        self.assertGreaterEqual(self.sent_at[1][1], RETRY_AFTER)
+
+    async def test_retry_after_defers_other_sends_to_chat(self):
+        started = time.monotonic()
+
+        async def request(chat_id: int) -> None:
+            self.sent_at.setdefault(chat_id, []).append(time.monotonic() - started)
+            if len(self.sent_at[chat_id]) == 1:
+                raise RetryAfter(RETRY_AFTER)
+
+        await fan_out([1], request)
+        await fan_out([1], request)
+
+        # вторая рассылка в тот же чат не отправляется раньше, чем разрешил Telegram
+        self.assertEqual(len(self.sent_at[1]), 3)
+        self.assertGreaterEqual(self.sent_at[1][1], RETRY_AFTER)
+
+    async def test_timed_out_is_retried_only_when_idempotent(self):
+        async def request(chat_id: int) -> None:
+            self.sent_at.setdefault(chat_id, []).append(time.monotonic())
+            raise TimedOut()
+
+        [delivery] = await fan_out([1], request)
+        [edit] = await fan_out([2], request, idempotent=True)
+
+        self.assertIsInstance(delivery.error, TimedOut)
+        self.assertEqual(len(self.sent_at[1]), 1)
+        self.assertEqual(len(self.sent_at[2]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
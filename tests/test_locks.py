@@ -0,0 +1,106 @@
+"""
+Тесты параллельной обработки обновлений KeyedUpdateProcessor. Запуск из корня репозитория:
+    python -m unittest discover -s tests -t .
+"""
+import asyncio
+import time
+import unittest
+
+from telegram import Update
+
+from marketing_budget_tennisi_bot.locks import KeyedUpdateProcessor, update_lock_keys
+
+HANDLER_TIME = 0.1
+
+
+def message_update(update_id: int, user_id: int, text: str = "текст") -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }, None)
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "test",
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "data": data,
+        },
+    }, None)
+
+
+class UpdateLockKeysTest(unittest.TestCase):
+
+    def test_user_key(self):
+        self.assertEqual(update_lock_keys(message_update(1, 10)), [("user", 10)])
+
+    def test_invoice_keys(self):
+        self.assertEqual(update_lock_keys(callback_update(1, 10, "payment_7")), [("invoice", 7), ("user", 10)])
+        self.assertEqual(update_lock_keys(message_update(1, 10, "/approve_record 7")), [("invoice", 7), ("user", 10)])
+
+    def test_not_update(self):
+        self.assertEqual(update_lock_keys(object()), [])
+
+
+class KeyedUpdateProcessorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.processor = KeyedUpdateProcessor(4)
+        self.running: dict[int, int] = {}
+        self.max_running: dict[int, int] = {}
+        self.finished_at: dict[int, float] = {}
+
+    async def handle(self, update: Update) -> None:
+        user_id = update.effective_user.id
+        self.running[user_id] = self.running.get(user_id, 0) + 1
+        self.max_running[user_id] = max(self.max_running.get(user_id, 0), self.running[user_id])
+        await asyncio.sleep(HANDLER_TIME)
+        self.running[user_id] -= 1
+        self.finished_at[update.update_id] = time.monotonic()
+
+    def process(self, update: Update) -> asyncio.Task:
+        return asyncio.create_task(self.processor.process_update(update, self.handle(update)))
+
+    async def test_burst_from_one_user_does_not_delay_another(self):
+        started = time.monotonic()
+        tasks = [self.process(message_update(i, user_id=1)) for i in range(6)]
+        await asyncio.sleep(0)
+        tasks.append(self.process(message_update(100, user_id=2)))
+        await asyncio.gather(*tasks)
+
+        # обновления пользователя 1 выполняются по очереди, но не занимают места в семафоре,
+        # поэтому пользователь 2 обслуживается сразу, а не после всей очереди пользователя 1
+        self.assertEqual(self.max_running[1], 1)
+        self.assertLess(self.finished_at[100] - started, HANDLER_TIME * 2)
+        self.assertGreaterEqual(self.finished_at[5] - started, HANDLER_TIME * 6)
+
+    async def test_concurrency_limit(self):
+        tasks = [self.process(message_update(i, user_id=i)) for i in range(8)]
+        await asyncio.sleep(HANDLER_TIME / 2)
+        self.assertEqual(self.processor.current_concurrent_updates, 4)
+        await asyncio.gather(*tasks)
+
+    async def test_same_invoice_is_serialized(self):
+        started = time.monotonic()
+        await asyncio.gather(
+            self.process(callback_update(1, 10, "payment_7")),
+            self.process(callback_update(2, 20, "payment_7")),
+        )
+        self.assertGreaterEqual(max(self.finished_at.values()) - started, HANDLER_TIME * 2)
+
+    async def test_idle_locks_are_released(self):
+        await asyncio.gather(*(self.process(message_update(i, user_id=i % 3)) for i in range(6)))
+        self.assertEqual(len(self.processor.locks), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
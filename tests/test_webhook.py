@@ -0,0 +1,269 @@
+"""
+Тесты режима webhook: HealthServer и run_webhook проверяются запросами через сокет,
+Bot API заменён локальным сервером. Запуск из корня репозитория:
+    python -m unittest discover -s tests -t .
+"""
+import asyncio
+import json
+import signal
+import socket
+import unittest
+from unittest import mock
+from urllib.parse import parse_qsl
+
+from telegram import Update
+from telegram.error import BadRequest
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from config.config import Config
+from marketing_budget_tennisi_bot.webhook import HEALTH_PATH, HealthServer, run_webhook
+
+SECRET = "test-secret"
+URL_PATH = "/telegram"
+WEBHOOK_URL = f"https://bot.example.com{URL_PATH}"
+TORNADO_MAX_BODY_SIZE = 100 * 1024 * 1024  # ограничение тела запроса в tornado по умолчанию
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+        "text": "/start",
+    },
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def http_request(port: int, method: str, path: str, body: bytes = b"",
+                       headers: dict[str, str] | None = None) -> tuple[int, bytes]:
+    """HTTP/1.1-запрос к 127.0.0.1:port; возвращает код ответа и тело."""
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    headers = {"Host": "127.0.0.1", "Content-Length": str(len(body)), "Connection": "close", **(headers or {})}
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\n".encode()
+        + "".join(f"{name}: {value}\r\n" for name, value in headers.items()).encode()
+        + b"\r\n" + body
+    )
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), 5)
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), payload
+
+
+class FakeApplication:
+    """Часть Application, которой пользуется HealthServer."""
+
+    def __init__(self, running: bool = True):
+        self.running = running
+        self.update_queue = asyncio.Queue()
+
+
+class HealthServerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.application = FakeApplication()
+        self.server = HealthServer(self.application, "127.0.0.1", 0)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_health(self):
+        self.application.update_queue.put_nowait(object())
+        status, body = await http_request(self.server.port, "GET", HEALTH_PATH)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {"ok": True, "update_queue": 1, "sheets_queue": {"read": 0, "write": 0}})
+
+    async def test_health_when_stopped(self):
+        self.application.running = False
+        status, body = await http_request(self.server.port, "GET", HEALTH_PATH)
+        self.assertEqual(status, 503)
+        self.assertFalse(json.loads(body)["ok"])
+
+    async def test_health_rejects_post(self):
+        status, _ = await http_request(self.server.port, "POST", HEALTH_PATH)
+        self.assertEqual(status, 405)
+
+    async def test_unknown_path(self):
+        status, _ = await http_request(self.server.port, "GET", "/other")
+        self.assertEqual(status, 404)
+
+
+class FakeBotAPI:
+    """
+    Локальная замена api.telegram.org: отвечает на методы Bot API и запоминает вызовы.
+    Методы из failing завершаются ошибкой 400.
+    """
+
+    def __init__(self):
+        self.calls: list[tuple[str, dict]] = []
+        self.failing: set[str] = set()
+        self._server: asyncio.Server | None = None
+        self.port = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while True:
+            try:
+                request_line = await reader.readuntil(b"\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            headers = {}
+            while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            method = request_line.decode().split(" ")[1].rsplit("/", 1)[-1]
+            if headers.get("content-type", "").startswith("application/json"):
+                params = json.loads(body or b"{}")
+            else:
+                params = dict(parse_qsl(body.decode()))
+            self.calls.append((method, params))
+
+            if method in self.failing:
+                status, response = 400, {"ok": False, "error_code": 400, "description": f"Bad Request: {method}"}
+            elif method == "getMe":
+                status, response = 200, {
+                    "ok": True,
+                    "result": {"id": 123456, "is_bot": True, "first_name": "Test", "username": "test_bot"},
+                }
+            else:
+                status, response = 200, {"ok": True, "result": True}
+            payload = json.dumps(response).encode()
+            writer.write(
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        writer.close()
+
+
+class RunWebhookTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.bot_api = FakeBotAPI()
+        await self.bot_api.start()
+        self.port = free_port()
+        self.health_port = free_port()
+        self.updates = []
+        self.received = asyncio.Event()
+        self.application = (
+            ApplicationBuilder()
+            .token(Config.telegram_bot_token)
+            .base_url(f"http://127.0.0.1:{self.bot_api.port}/bot")
+            .post_init(mock.AsyncMock())
+            .post_shutdown(mock.AsyncMock())
+            .build()
+        )
+        self.application.add_handler(TypeHandler(Update, self.on_update))
+        patcher = mock.patch.multiple(
+            Config,
+            telegram_webhook_url=WEBHOOK_URL,
+            webhook_secret_token=SECRET,
+            webhook_listen="127.0.0.1",
+            webhook_port=self.port,
+            webhook_health_port=self.health_port,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.bot_api.stop()
+
+    async def on_update(self, update: Update, context) -> None:
+        self.updates.append(update)
+        self.received.set()
+
+    async def start_bot(self) -> asyncio.Task:
+        task = asyncio.create_task(run_webhook(self.application))
+        for _ in range(250):
+            if self.application.running:
+                return task
+            await asyncio.sleep(0.02)
+        self.fail("run_webhook не запустил бота")
+
+    async def stop_bot(self, task: asyncio.Task) -> None:
+        signal.raise_signal(signal.SIGTERM)
+        await asyncio.wait_for(task, 5)
+
+    async def post_update(self, body: bytes, secret: str | None = SECRET, path: str = URL_PATH) -> int:
+        headers = {"Content-Type": "application/json"}
+        if secret is not None:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+        status, _ = await http_request(self.port, "POST", path, body, headers)
+        return status
+
+    async def test_update_is_processed_and_webhook_registered(self):
+        task = await self.start_bot()
+        status = await self.post_update(json.dumps(UPDATE).encode())
+        await asyncio.wait_for(self.received.wait(), 5)
+        health_status, health = await http_request(self.health_port, "GET", HEALTH_PATH)
+        await self.stop_bot(task)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(self.updates[0].update_id, 1)
+        self.assertEqual((health_status, json.loads(health)["ok"]), (200, True))
+        set_webhook = dict(self.bot_api.calls)["setWebhook"]
+        self.assertEqual(set_webhook["url"], WEBHOOK_URL)
+        self.assertEqual(set_webhook["secret_token"], SECRET)
+        self.assertFalse(self.application.running)
+        self.application.post_init.assert_awaited_once()
+        self.application.post_shutdown.assert_awaited_once()
+
+    async def test_rejected_requests(self):
+        task = await self.start_bot()
+        try:
+            body = json.dumps(UPDATE).encode()
+            self.assertEqual(await self.post_update(body, secret="wrong"), 403)
+            self.assertEqual(await self.post_update(body, secret=None), 403)
+            self.assertEqual(await self.post_update(body, path="/other"), 404)
+            self.assertEqual(await self.post_update(json.dumps({"message": UPDATE["message"]}).encode()), 400)
+            # некорректный JSON webhook-сервер python-telegram-bot отклоняет ошибкой 500
+            self.assertGreaterEqual(await self.post_update(b"{not json"), 400)
+
+            reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+            writer.write(
+                f"POST {URL_PATH} HTTP/1.1\r\nContent-Type: application/json\r\n"
+                f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n"
+                f"Content-Length: {TORNADO_MAX_BODY_SIZE + 1}\r\n\r\n".encode()
+            )
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            self.assertTrue(response.startswith(b"HTTP/1.1 400 "))
+
+            await asyncio.sleep(0.1)
+            self.assertEqual(self.updates, [])
+        finally:
+            await self.stop_bot(task)
+
+    async def test_post_shutdown_runs_when_set_webhook_fails(self):
+        self.bot_api.failing.add("setWebhook")
+
+        with self.assertRaises(BadRequest):
+            await asyncio.wait_for(run_webhook(self.application), 5)
+
+        self.application.post_init.assert_awaited_once()
+        self.application.post_shutdown.assert_awaited_once()
+        self.assertFalse(self.application.running)
+        self.assertFalse(self.application.updater.running)
+
+
+if __name__ == "__main__":
+    unittest.main()